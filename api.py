@@ -0,0 +1,140 @@
+# api.py - Helpers for the JSON catalog API: sparse fields, cursors and conditional GET
+import hashlib
+from datetime import timezone
+
+from flask import request, jsonify, url_for, Response
+from sqlalchemy import select, func
+
+from models import db, Wildlife, Safari, SiteStat
+from stats import COUNTED_MODELS
+
+API_PER_PAGE = 50
+API_MAX_PER_PAGE = 200
+
+# Fields each resource can return, and the query string filters it accepts
+API_RESOURCES = {
+    'wildlife': {
+        'model': Wildlife,
+        'fields': ('id', 'title', 'description', 'category', 'price', 'location', 'status',
+                   'image_url', 'updated_at'),
+        'filters': ('category', 'status'),
+    },
+    'safari': {
+        'model': Safari,
+        'fields': ('id', 'name', 'description', 'price', 'duration', 'safari_count', 'tier',
+                   'image_url', 'updated_at'),
+        'filters': ('tier',),
+    },
+}
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def requested_fields(resource):
+    """Fields named in ?fields=a,b (always with id), or all of them"""
+    allowed = API_RESOURCES[resource]['fields']
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    if not names:
+        return allowed
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise APIError(f"Unknown field(s): {', '.join(unknown)}")
+    return tuple(name for name in allowed if name == 'id' or name in names)
+
+
+def serialize(fields, values):
+    record = dict(zip(fields, values))
+    if record.get('image_url'):
+        record['image_url'] = url_for('static', filename='uploads/' + record['image_url'], _external=True)
+    if record.get('updated_at'):
+        record['updated_at'] = record['updated_at'].isoformat()
+    return record
+
+
+def list_page(resource):
+    """Validators for one cursor page and a loader that queries it; returns (etag, last_modified, loader)"""
+    spec = API_RESOURCES[resource]
+    model = spec['model']
+    fields = requested_fields(resource)
+    limit = request.args.get('limit', API_PER_PAGE, type=int)
+    if limit is None or limit < 1:
+        raise APIError('limit must be a whole number of at least 1')
+    limit = min(limit, API_MAX_PER_PAGE)
+    cursor = request.args.get('cursor', '')
+    if cursor and not cursor.isdigit():
+        raise APIError('Invalid cursor')
+
+    # Keyset pagination on id
+    conditions = [getattr(model, name) == request.args[name] for name in spec['filters'] if request.args.get(name)]
+    if cursor:
+        conditions.append(model.id > int(cursor))
+
+    # The validators come from a version of the whole table, read without
+    # touching the page: any insert or edit moves max(updated_at) (an indexed
+    # lookup) and the row count in the stats table versions deletes. A
+    # conditional GET that matches is answered from this one query. (Any
+    # change to the table changes every page's ETag; Last-Modified alone
+    # can't show a delete, so clients should prefer the ETag.)
+    last_modified, total = db.session.execute(select(
+        func.max(model.updated_at),
+        select(SiteStat.value).where(SiteStat.name == COUNTED_MODELS[model]).scalar_subquery()
+    )).one()
+    etag = _etag(resource, total, last_modified, fields, limit, cursor,
+                 sorted((name, request.args[name]) for name in spec['filters'] if request.args.get(name)))
+
+    def load():
+        # One more row than the page shows tells whether there is a next page
+        rows = db.session.execute(
+            select(*(getattr(model, name) for name in fields))
+            .where(*conditions).order_by(model.id).limit(limit + 1)
+        ).all()
+        page = rows[:limit]
+        next_cursor = str(page[-1][0]) if len(rows) > limit else None
+        return {'items': [serialize(fields, row) for row in page], 'next_cursor': next_cursor}
+
+    return etag, last_modified, load
+
+
+def detail(resource, row):
+    """Validators and body for one row; returns (etag, last_modified, loader)"""
+    fields = requested_fields(resource)
+    etag = _etag(resource, row.id, row.updated_at, fields)
+    return etag, row.updated_at, lambda: serialize(fields, [getattr(row, name) for name in fields])
+
+
+def conditional_json(etag, last_modified, load):
+    """A JSON response, or an empty 304 when the client's copy is still current"""
+    if _not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        response = jsonify(load())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = _utc(last_modified)
+    # Clients may keep a copy but must revalidate it, which is cheap
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _utc(value):
+    # Timestamps are stored as naive local time
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match wins over If-Modified-Since when both are sent
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return _utc(last_modified) <= request.if_modified_since
+    return False
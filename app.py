@@ -1,95 +1,209 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, session, \
+    Response, stream_with_context, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from flask_bcrypt import Bcrypt
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 import os
-from datetime import datetime
-
-
-# Create Flask app first
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('dev-secret-key-change-in-production')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///wildlife.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATION'] = False
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
-
-# Create upload folder
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-# Initialize extensions
-from models import db
+import io
+import csv
+import json
+import itertools
+import uuid
+import click
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from config import config, engine_options, DEFAULT_SECRET_KEY
+from models import db, User, Wildlife, Safari, CartItem, Order, OrderItem, load_products, product_for
+from search import search_wildlife, init_search_index, search_index_supported
+from images import responsive_image, has_derivatives, generate_derivatives
+from storage import store_upload, hold_upload_lock, is_fingerprinted, IMMUTABLE_CACHE_CONTROL
+from cache import catalog_cache, list_tag, row_tags
+from recommend import recommendations
+from stats import get_counters, reconcile_counters, recent_orders
+from identity import user_cache, add_cart_item, clear_cart, cart_quantity
+from migrations import upgrade_database, current_version
+from passwords import passwords, PasswordServiceBusy
+from metrics import request_metrics
+from fragments import FragmentCacheExtension
+from jobs import Worker, enqueue, queue_stats
+import tasks  # registers the job handlers
+from api import APIError, list_page, detail, conditional_json
+from catalog import CATALOGS, FORMATS, import_catalog, export_catalog, detect_format, RowError
+from inventory import availability, hold_seats, release_hold, confirm_holds, set_capacity, \
+    sweep_expired_holds, InventoryError, SoldOut
+from cart import CartError, parse_operations, apply_operations, cart_contents
+from assets import static_assets, build_assets
+from pagecache import page_cache
+from startup import timed_init, template_bytecode_cache
+
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+
+# Views, request hooks and CLI commands; create_app registers them on each app
+bp = Blueprint('main', __name__, cli_group=None)
+
+
+def create_app(config_name=None):
+    """Create the Flask app from a named config profile.
+
+    The profile comes from FLASK_CONFIG when not given: development (default),
+    testing or production.
+    """
+    config_name = config_name or os.environ.get('FLASK_CONFIG', 'default')
+    app = Flask(__name__)
+    app.config.from_object(config[config_name])
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+
+    if config_name == 'production' and app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+        raise RuntimeError('Set SECRET_KEY before running with the production config')
+    # The stub approves every order without taking any money
+    if config_name == 'production' and (app.config['PAYMENT_PROVIDER'] != 'stripe' or not app.config['STRIPE_SECRET_KEY']
+                                        or not app.config['STRIPE_PUBLISHABLE_KEY']):
+        raise RuntimeError('Set STRIPE_SECRET_KEY and STRIPE_PUBLISHABLE_KEY (and PAYMENT_PROVIDER=stripe) '
+                           'before running with the production config')
+
+    # Initialize extensions; `flask profile-startup` reports each step's time
+    timed_init(app, [
+        ('templates', configure_templates),
+        ('db', db.init_app),
+        ('sqlite', configure_sqlite),
+        ('login', login_manager.init_app),
+        ('catalog_cache', catalog_cache.init_app),
+        ('recommendations', recommendations.init_app),
+        ('user_cache', user_cache.init_app),
+        ('passwords', passwords.init_app),
+        ('metrics', request_metrics.init_app),
+        ('availability', availability.init_app),
+        ('static_assets', static_assets.init_app),
+        ('page_cache', page_cache.init_app),
+    ])
+    app.register_blueprint(bp)
+
+    return app
+
+
+def configure_templates(app):
+    """Jinja setup; the bytecode cache has to be in place before the environment is created"""
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': template_bytecode_cache(app)}
+    app.add_template_global(responsive_image)
+    app.add_template_global(has_derivatives)
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache.init_app(app)
+
+
+def configure_sqlite(app):
+    """Apply SQLITE_PRAGMAS to every new connection when the database is SQLite"""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
 
-db.init_app(app)
-#db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
+    pragmas = app.config['SQLITE_PRAGMAS']
 
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
 
-login_manager = LoginManager(app)
-login_manager.init_app(app)
-login_manager.login_view = 'login'
 
-# Import models after db initialization
-from models import User, Wildlife, Safari, CartItem, Order, OrderItem
+@bp.after_app_request
+def cache_fingerprinted_uploads(response):
+    # Content-addressed uploads never change, so caches need not revalidate them
+    if request.endpoint == 'static' and response.status_code in (200, 304) \
+            and request.view_args.get('filename', '').startswith('uploads/') \
+            and is_fingerprinted(request.view_args['filename']):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 
 # ==================== ROUTES ====================
 
-@app.route('/')
+@bp.route('/')
 def index():
-    safaris = Safari.query.limit(4).all()
-    wildlife = Wildlife.query.limit(8).all()
+    safaris, wildlife = catalog_cache.get_or_load(
+        ('home',),
+        lambda: (Safari.query.limit(4).all(), Wildlife.query.limit(8).all()),
+        tags=(list_tag('safari'), list_tag('wildlife'))
+    )
     return render_template('index.html', safaris=safaris, wildlife=wildlife)
 
 
-@app.route('/wildlife')
+@bp.route('/wildlife')
 def wildlife_gallery():
-    wildlife = Wildlife.query.all()
-    return render_template('wildlife/gallery.html', wildlife=wildlife)
-
-@app.route('/wildlife/<int:id>')
+    q = request.args.get('q', '').strip()
+    category = request.args.get('category', '').strip()
+    page = request.args.get('page', 1, type=int)
+
+    # Search, filter and paginate in the database, ranked by relevance
+    pagination = catalog_cache.get_or_load(
+        ('gallery', q, category, page),
+        lambda: search_wildlife(q, category, page),
+        tags=(list_tag('wildlife'),)
+    )
+    return render_template('wildlife/gallery.html',
+                           wildlife=pagination.items,
+                           pagination=pagination,
+                           q=q,
+                           category=category)
+
+@bp.route('/wildlife/<int:id>')
 def wildlife_detail(id):
-    animal = Wildlife.query.get_or_404(id)
-    # Get similar wildlife (same category)
-    similar = Wildlife.query.filter(
-        Wildlife.category == animal.category,
-        Wildlife.id != animal.id
-    ).limit(3).all()
-    return render_template('wildlife/detail.html', animal=animal, similar=similar)
+    animal = catalog_cache.get_or_load(
+        ('wildlife', id), lambda: db.session.get(Wildlife, id), tags=row_tags('wildlife', id)
+    )
+    if animal is None:
+        abort(404)
 
-@app.route('/safaris')
+    # Get similar wildlife (precomputed, by description and category)
+    similar = get_similar_wildlife(animal)
+    return render_template('wildlife/detail.html', animal=animal, similar_animals=similar)
+
+@bp.route('/safaris')
 def safari_packages():
-    safaris = Safari.query.all()
+    safaris = catalog_cache.get_or_load(('safaris',), lambda: Safari.query.all(), tags=(list_tag('safari'),))
     return render_template('wildlife/packages.html', safaris=safaris)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
         user = User.query.filter_by(email=email).first()
 
-        if user and check_password_hash(user.password, password):
+        try:
+            valid, new_hash = passwords.verify(user.password if user else None, password)
+        except PasswordServiceBusy as e:
+            flash('Too many sign-ins right now, please try again in a moment', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': str(e.retry_after)}
+
+        if valid:
+            if new_hash:
+                # Stored with an older algorithm or cost; upgrade it now we know the password
+                user.password = new_hash
+                db.session.commit()
             login_user(user)
             flash('Login successful!', 'success')
             next_page = request.args.get('next')
-            return redirect(next_page if next_page else url_for('index'))
+            return redirect(next_page if next_page else url_for('main.index'))
         else:
             flash('Invalid email or password', 'danger')
 
     return render_template('login.html')
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         email = request.form['email']
@@ -98,57 +212,43 @@ def register():
 
         if password != confirm_password:
             flash('Passwords do not match', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
         if User.query.filter_by(email=email).first():
             flash('Email already registered', 'danger')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
 
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = passwords.hash(password)
+        except PasswordServiceBusy as e:
+            flash('Too many sign-ups right now, please try again in a moment', 'warning')
+            return render_template('register.html'), 503, {'Retry-After': str(e.retry_after)}
         user = User(email=email, password=hashed_password)
         db.session.add(user)
         db.session.commit()
 
         flash('Registration successful! Please login.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('register.html')
 
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/cart')
+@bp.route('/cart')
 @login_required
 def view_cart():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    total = 0
-    items = []
-
-    for item in cart_items:
-        if item.product_type == 'wildlife':
-            product = Wildlife.query.get(item.product_id)
-        else:
-            product = Safari.query.get(item.product_id)
-
-        if product:
-            item_total = float(product.price) * item.quantity
-            total += item_total
-            items.append({
-                'cart_item': item,
-                'product': product,
-                'total': item_total
-            })
-
-    return render_template('cart/view_cart.html', items=items, total=total)
+    items, holds, total = cart_contents(current_user.id)
+    return render_template('cart/view_cart.html', items=items, holds=holds, total=total)
 
 
-@app.route('/cart/add', methods=['POST'])
+@bp.route('/cart/add', methods=['POST'])
 @login_required
 def add_to_cart():
     try:
@@ -164,26 +264,10 @@ def add_to_cart():
         if not product:
             return jsonify({'success': False, 'message': 'Product not found'}), 404
 
-        cart_item = CartItem.query.filter_by(
-            user_id=current_user.id,
-            product_id=product_id,
-            product_type=product_type
-        ).first()
-
-        if cart_item:
-            cart_item.quantity += 1
-        else:
-            cart_item = CartItem(
-                user_id=current_user.id,
-                product_id=product_id,
-                product_type=product_type,
-                quantity=1
-            )
-            db.session.add(cart_item)
-
+        add_cart_item(current_user.id, product_type, product_id)
         db.session.commit()
 
-        cart_count = CartItem.query.filter_by(user_id=current_user.id).count()
+        cart_count = cart_quantity(current_user.id)
 
         return jsonify({
             'success': True,
@@ -195,14 +279,46 @@ def add_to_cart():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
-@app.route('/cart/update/<int:item_id>', methods=['POST'])
+@bp.route('/cart/batch', methods=['POST'])
+@login_required
+def cart_batch():
+    """Apply several cart changes in one transaction and return the new cart.
+
+    Takes {"operations": [...]}, each {"op": "add", "product_type",
+    "product_id", "quantity"}, {"op": "set", "item_id", "quantity"} or
+    {"op": "remove", "item_id"}. Nothing is applied if one is invalid.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        apply_operations(current_user.id, parse_operations(data.get('operations')))
+        db.session.commit()
+    except CartError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': e.message}), e.status
+
+    items, holds, total = cart_contents(current_user.id)
+    return jsonify({
+        'success': True,
+        'cart_count': cart_quantity(current_user.id),
+        'subtotal': total,
+        'items': [{
+            'id': item['cart_item'].id,
+            'product_type': item['cart_item'].product_type,
+            'product_id': item['cart_item'].product_id,
+            'quantity': item['cart_item'].quantity,
+            'total': item['total']
+        } for item in items]
+    })
+
+
+@bp.route('/cart/update/<int:item_id>', methods=['POST'])
 @login_required
 def update_cart_item(item_id):
     cart_item = CartItem.query.get_or_404(item_id)
 
     if cart_item.user_id != current_user.id:
         flash('Unauthorized action', 'danger')
-        return redirect(url_for('view_cart'))
+        return redirect(url_for('main.view_cart'))
 
     action = request.form.get('action')
 
@@ -214,92 +330,121 @@ def update_cart_item(item_id):
         db.session.delete(cart_item)
         db.session.commit()
         flash('Item removed from cart', 'info')
-        return redirect(url_for('view_cart'))
+        return redirect(url_for('main.view_cart'))
 
     db.session.commit()
-    return redirect(url_for('view_cart'))
+    return redirect(url_for('main.view_cart'))
 
 
-@app.route('/checkout', methods=['GET', 'POST'])
+@bp.route('/cart/hold/<int:hold_id>/remove', methods=['POST'])
 @login_required
-def checkout():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+def remove_seat_hold(hold_id):
+    if release_hold(hold_id, current_user.id):
+        db.session.commit()
+        flash('Seats released', 'info')
+    return redirect(url_for('main.view_cart'))
 
-    if not cart_items:
-        flash('Your cart is empty', 'warning')
-        return redirect(url_for('view_cart'))
 
-    total = 0
-    items = []
+@bp.route('/checkout', methods=['GET', 'POST'])
+@login_required
+def checkout():
+    if request.method == 'POST':
+        # A retried or double-clicked submit gets the order the first one created
+        idempotency_key = (request.form.get('idempotency_key') or request.headers.get('Idempotency-Key') or '')[:64] or None
+        existing = find_order_by_key(current_user.id, idempotency_key)
+        if existing:
+            session['order_id'] = existing.id
+            return redirect(url_for('main.order_summary'))
 
-    for item in cart_items:
-        if item.product_type == 'wildlife':
-            product = Wildlife.query.get(item.product_id)
-        else:
-            product = Safari.query.get(item.product_id)
+    items, holds, total = cart_contents(current_user.id)
 
-        if product:
-            item_total = float(product.price) * item.quantity
-            total += item_total
-            items.append({
-                'cart_item': item,
-                'product': product,
-                'total': item_total
-            })
+    if not items and not holds:
+        flash('Your cart is empty', 'warning')
+        return redirect(url_for('main.view_cart'))
 
     if request.method == 'POST':
+        payment_method = request.form.get('payment_method')
+        # The card's PaymentMethod id, posted by Stripe.js on the checkout page
+        payment_token = request.form.get('payment_token') if payment_method == 'card' else None
         order = Order(
             user_id=current_user.id,
             total_amount=total,
             payment_status='pending',
+            payment_method=payment_method,
+            payment_token=(payment_token or '')[:255] or None,
             shipping_address=request.form.get('address'),
             shipping_city=request.form.get('city'),
             shipping_state=request.form.get('state'),
-            shipping_pincode=request.form.get('pincode')
+            shipping_pincode=request.form.get('pincode'),
+            idempotency_key=idempotency_key
         )
-        db.session.add(order)
-        db.session.commit()
 
-        for item in cart_items:
-            if item.product_type == 'wildlife':
-                product = Wildlife.query.get(item.product_id)
-            else:
-                product = Safari.query.get(item.product_id)
-
-            order_item = OrderItem(
-                order_id=order.id,
-                product_type=item.product_type,
-                product_id=item.product_id,
-                quantity=item.quantity,
-                price=product.price if product else 0
-            )
-            db.session.add(order_item)
-
-        CartItem.query.filter_by(user_id=current_user.id).delete()
-        db.session.commit()
+        # One short transaction: the order, all of its items (prices taken from
+        # the products fetched above), emptying the cart, selling the held seats
+        # and queueing the payment commit together
+        try:
+            db.session.add(order)
+            db.session.flush()
+
+            db.session.bulk_insert_mappings(OrderItem, [{
+                'order_id': order.id,
+                'product_type': item['cart_item'].product_type,
+                'product_id': item['cart_item'].product_id,
+                'quantity': item['cart_item'].quantity,
+                'price': item['product'].price
+            } for item in items] + [{
+                'order_id': order.id,
+                'product_type': 'safari',
+                'product_id': item['hold'].safari_id,
+                'quantity': item['hold'].seats,
+                'price': item['product'].price,
+                'travel_date': item['hold'].date
+            } for item in holds])
+
+            confirm_holds([item['hold'] for item in holds])
+            clear_cart(current_user.id)
+            enqueue('charge_order', {'order_id': order.id})
+            db.session.commit()
+        except InventoryError as e:
+            db.session.rollback()
+            flash(str(e), 'warning')
+            return redirect(url_for('main.view_cart'))
+        except IntegrityError:
+            # A concurrent submit with the same key won the race
+            db.session.rollback()
+            order = find_order_by_key(current_user.id, idempotency_key)
+            if order is None:
+                raise
 
         session['order_id'] = order.id
-        return redirect(url_for('order_summary'))
+        return redirect(url_for('main.order_summary'))
+
+    stripe_key = current_app.config['STRIPE_PUBLISHABLE_KEY'] if current_app.config['PAYMENT_PROVIDER'] == 'stripe' else None
+    return render_template('cart/checkout.html', items=items, holds=holds, total=total,
+                           idempotency_key=uuid.uuid4().hex, stripe_key=stripe_key)
+
 
-    return render_template('cart/checkout.html', items=items, total=total)
+def find_order_by_key(user_id, idempotency_key):
+    if not idempotency_key:
+        return None
+    return Order.query.filter_by(user_id=user_id, idempotency_key=idempotency_key).first()
 
 #----------order summary inserted
-@app.route('/my-orders')
+@bp.route('/my-orders')
 @login_required
 def my_orders():
     """Display all orders for the current user"""
     orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
 
-    # Get order items for each order
+    # Get order items for all orders in one go
+    items_by_order = load_order_items(orders)
+    products = load_products([item for items in items_by_order.values() for item in items])
+
     orders_with_items = []
     for order in orders:
-        order_items = OrderItem.query.filter_by(order_id=order.id).all()
         items = []
-        for item in order_items:
-            if item.product_type == 'wildlife':
-                product = Wildlife.query.get(item.product_id)
-            else:
-                product = Safari.query.get(item.product_id)
+        for item in items_by_order.get(order.id, []):
+            product = product_for(products, item)
             items.append({
                 'order_item': item,
                 'product': product
@@ -311,27 +456,25 @@ def my_orders():
 
     return render_template('profile/orders.html', orders=orders_with_items)
 #------------ end---------------
-@app.route('/order/summary')
+@bp.route('/order/summary')
 @login_required
 def order_summary():
     order_id = session.get('order_id')
     if not order_id:
         flash('No order found', 'warning')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     order = Order.query.get(order_id)
     if not order or order.user_id != current_user.id:
         flash('Order not found', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     order_items = OrderItem.query.filter_by(order_id=order.id).all()
+    products = load_products(order_items)
     items = []
 
     for item in order_items:
-        if item.product_type == 'wildlife':
-            product = Wildlife.query.get(item.product_id)
-        else:
-            product = Safari.query.get(item.product_id)
+        product = product_for(products, item)
 
         items.append({
             'order_item': item,
@@ -341,52 +484,46 @@ def order_summary():
     return render_template('cart/order_summary.html', order=order, items=items)
 
 
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
 def admin_dashboard():
     if not current_user.is_admin:
         flash('Access denied', 'danger')
-        return redirect(url_for('index'))
-
-    stats = {
-        'total_wildlife': Wildlife.query.count(),
-        'total_safaris': Safari.query.count(),
-        'total_orders': Order.query.count(),
-        'total_users': User.query.count(),
-        'recent_orders': Order.query.order_by(Order.created_at.desc()).limit(5).all()
-    }
+        return redirect(url_for('main.index'))
+
+    # Counters are maintained on insert/delete, recent orders on commit
+    stats = get_counters()
+    stats['recent_orders'] = recent_orders.latest()
     # Pass current date to template
     current_date = datetime.now()
 
     return render_template('admin/dashboard.html', stats=stats, date=current_date)
 
 
-@app.route('/admin/wildlife')
+@bp.route('/admin/wildlife')
 @login_required
 def manage_wildlife():
     if not current_user.is_admin:
         flash('Access denied', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     wildlife = Wildlife.query.all()
     return render_template('admin/manage_wildlife.html', wildlife=wildlife)
 
 
-@app.route('/admin/wildlife/add', methods=['GET', 'POST'])
+@bp.route('/admin/wildlife/add', methods=['GET', 'POST'])
 @login_required
 def add_wildlife():
     if not current_user.is_admin:
         flash('Access denied', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     if request.method == 'POST':
         try:
             file = request.files['image']
             filename = None
             if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                filename = save_upload(file)
 
             wildlife = Wildlife(
                 title=request.form['title'],
@@ -401,7 +538,7 @@ def add_wildlife():
             db.session.add(wildlife)
             db.session.commit()
             flash('Wildlife added successfully', 'success')
-            return redirect(url_for('manage_wildlife'))
+            return redirect(url_for('main.manage_wildlife'))
 
         except Exception as e:
             flash(f'Error: {str(e)}', 'danger')
@@ -409,12 +546,12 @@ def add_wildlife():
     return render_template('admin/add_wildlife.html')
 
 
-@app.route('/admin/wildlife/edit/<int:id>', methods=['GET', 'POST'])
+@bp.route('/admin/wildlife/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_wildlife(id):
     if not current_user.is_admin:
         flash('Access denied', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     wildlife = Wildlife.query.get_or_404(id)
 
@@ -427,61 +564,79 @@ def edit_wildlife(id):
             wildlife.location = request.form.get('location', '')
             wildlife.status = request.form.get('status', 'Available')
 
+            old_image = None
             file = request.files.get('image')
             if file and file.filename != '':
-                if wildlife.image_url and wildlife.image_url != 'default-wildlife.jpg':
-                    old_path = os.path.join(app.config['UPLOAD_FOLDER'], wildlife.image_url)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                filename = save_upload(file)
+                if wildlife.image_url != filename:
+                    old_image = wildlife.image_url
                 wildlife.image_url = filename
 
+            # Commits with the change, so the old file goes only once the
+            # row no longer points at it
+            if old_image and old_image != 'default-wildlife.jpg':
+                enqueue('release_image', {'filename': old_image})
             db.session.commit()
+
             flash('Wildlife updated successfully', 'success')
-            return redirect(url_for('manage_wildlife'))
+            return redirect(url_for('main.manage_wildlife'))
 
         except Exception as e:
             flash(f'Error: {str(e)}', 'danger')
 
     return render_template('admin/edit_wildlife.html', wildlife=wildlife)
 #-----------------------------safari
-@app.route('/admin/safaris')
+@bp.route('/admin/safaris')
 @login_required
 def manage_safaris():
     if not current_user.is_admin:
         flash('Access denied', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     safaris = Safari.query.all()
     return render_template('admin/manage_safaris.html', safaris=safaris)
 
 
-@app.route('/admin/orders')
+@bp.route('/admin/orders')
 @login_required
 def view_orders():
-    """Admin view all orders"""
+    """Admin view all orders, one keyset page at a time"""
     if not current_user.is_admin:
         flash('Access denied', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
+
+    filters = order_filters_from_request()
+    per_page = max(1, min(request.args.get('per_page', ORDERS_PER_PAGE, type=int) or ORDERS_PER_PAGE, 200))
+    query = filter_orders(Order.query, filters)
+
+    # Keyset pagination on (created_at, id), newest first
+    cursor = parse_order_cursor(request.args.get('cursor'))
+    if cursor:
+        created_at, order_id = cursor
+        query = query.filter(db.or_(
+            Order.created_at < created_at,
+            db.and_(Order.created_at == created_at, Order.id < order_id)
+        ))
+
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(orders) > per_page:
+        orders = orders[:per_page]
+        next_cursor = format_order_cursor(orders[-1])
+
+    # Get users, items and products for the page in one go
+    user_ids = {order.user_id for order in orders}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    items_by_order = load_order_items(orders)
+    products = load_products([item for items in items_by_order.values() for item in items])
 
-    # Get all orders with user information
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-
-    # Get order details for each order
     orders_with_details = []
     for order in orders:
-        user = User.query.get(order.user_id)
-        order_items = OrderItem.query.filter_by(order_id=order.id).all()
+        user = users.get(order.user_id)
 
         items = []
-        for item in order_items:
-            if item.product_type == 'wildlife':
-                product = Wildlife.query.get(item.product_id)
-            else:
-                product = Safari.query.get(item.product_id)
+        for item in items_by_order.get(order.id, []):
+            product = product_for(products, item)
 
             items.append({
                 'order_item': item,
@@ -494,15 +649,68 @@ def view_orders():
             'items': items
         })
 
-    return render_template('admin/view_orders.html', orders=orders_with_details)
+    return render_template('admin/view_orders.html',
+                           orders=orders_with_details,
+                           filters=filters,
+                           next_cursor=next_cursor,
+                           per_page=per_page)
 
 
-@app.route('/admin/safari/add', methods=['GET', 'POST'])
+@bp.route('/admin/orders/export')
+@login_required
+def export_orders():
+    """Stream the filtered orders as CSV or JSON lines"""
+    if not current_user.is_admin:
+        flash('Access denied', 'danger')
+        return redirect(url_for('main.index'))
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return jsonify({'success': False, 'message': 'Unknown export format'}), 400
+
+    query = filter_orders(
+        db.session.query(Order, User.email).join(User, User.id == Order.user_id),
+        order_filters_from_request()
+    ).order_by(Order.created_at.desc(), Order.id.desc()).yield_per(EXPORT_BATCH_SIZE)
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(ORDER_EXPORT_FIELDS)
+            yield buffer.getvalue()
+
+        rows = iter(query)
+        while True:
+            batch = list(itertools.islice(rows, EXPORT_BATCH_SIZE))
+            if not batch:
+                break
+
+            items_by_order = load_order_items([order for order, _ in batch])
+            products = load_products([item for items in items_by_order.values() for item in items])
+
+            buffer.seek(0)
+            buffer.truncate()
+            for order, email in batch:
+                record = order_export_record(order, email, items_by_order.get(order.id, []), products)
+                if export_format == 'csv':
+                    writer.writerow([record[field] for field in ORDER_EXPORT_FIELDS])
+                else:
+                    buffer.write(json.dumps(record) + '\n')
+            yield buffer.getvalue()
+
+    filename = f"orders-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@bp.route('/admin/safari/add', methods=['GET', 'POST'])
 @login_required
 def add_safari():
     if not current_user.is_admin:
         flash('Access denied', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     if request.method == 'POST':
         try:
@@ -510,9 +718,7 @@ def add_safari():
             file = request.files.get('image')
             filename = None
             if file and file.filename != '':
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                filename = save_upload(file)
 
             # Create safari entry
             safari = Safari(
@@ -528,34 +734,153 @@ def add_safari():
             db.session.add(safari)
             db.session.commit()
             flash('Safari added successfully', 'success')
-            return redirect(url_for('manage_safaris'))
+            return redirect(url_for('main.manage_safaris'))
 
         except Exception as e:
             flash(f'Error: {str(e)}', 'danger')
 
     # For GET request, you need to create admin/add_safari.html
     # For now, redirect to manage_safaris
-    return redirect(url_for('manage_safaris'))
+    return redirect(url_for('main.manage_safaris'))
+
+
+def load_order_items(orders):
+    """Fetch the items of several orders in one query, grouped by order id"""
+    order_ids = [order.id for order in orders]
+    items_by_order = {}
+    if not order_ids:
+        return items_by_order
+    for item in OrderItem.query.filter(OrderItem.order_id.in_(order_ids)).all():
+        items_by_order.setdefault(item.order_id, []).append(item)
+    return items_by_order
+
+
+def save_upload(file):
+    """Store an uploaded image by content hash and queue its resized derivatives"""
+    # Until the row using it commits, the file must not be released
+    hold_upload_lock(db.session(), current_app.config['UPLOAD_FOLDER'])
+    filename, created = store_upload(file, current_app.config['UPLOAD_FOLDER'])
+    if created:
+        # Queued with the row that uses the image
+        enqueue('generate_derivatives', {'filename': filename})
+    return filename
+
+
+ORDERS_PER_PAGE = 50
+EXPORT_BATCH_SIZE = 500
+ORDER_EXPORT_FIELDS = [
+    'id', 'created_at', 'user_email', 'payment_status', 'payment_method', 'total_amount',
+    'shipping_address', 'shipping_city', 'shipping_state', 'shipping_pincode', 'items'
+]
+
+
+def order_filters_from_request():
+    """Read the order list filters (status, user, date range) from the query string"""
+    return {
+        'status': request.args.get('status', '').strip(),
+        'user': request.args.get('user', '').strip(),
+        'date_from': request.args.get('date_from', '').strip(),
+        'date_to': request.args.get('date_to', '').strip()
+    }
+
+
+def filter_orders(query, filters):
+    """Apply order list filters to a query over Order"""
+    if filters['status']:
+        query = query.filter(Order.payment_status == filters['status'])
+
+    if filters['user']:
+        if filters['user'].isdigit():
+            query = query.filter(Order.user_id == int(filters['user']))
+        else:
+            user_ids = db.session.query(User.id).filter(User.email == filters['user'])
+            query = query.filter(Order.user_id.in_(user_ids.scalar_subquery()))
+
+    try:
+        if filters['date_from']:
+            query = query.filter(Order.created_at >= datetime.strptime(filters['date_from'], '%Y-%m-%d'))
+        if filters['date_to']:
+            date_to = datetime.strptime(filters['date_to'], '%Y-%m-%d') + timedelta(days=1)
+            query = query.filter(Order.created_at < date_to)
+    except ValueError:
+        abort(400)
+
+    return query
+
+
+def format_order_cursor(order):
+    return f"{order.created_at.isoformat()}_{order.id}"
+
+
+def parse_order_cursor(cursor):
+    """Turn a cursor from format_order_cursor back into (created_at, id)"""
+    if not cursor:
+        return None
+    try:
+        created_at, order_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        abort(400)
+
+
+def order_export_record(order, email, order_items, products):
+    """Flatten an order into a dict for CSV/JSONL export"""
+    items = []
+    for item in order_items:
+        product = product_for(products, item)
+        if product is None:
+            name = f'{item.product_type} #{item.product_id}'
+        else:
+            name = product.title if item.product_type == 'wildlife' else product.name
+        items.append(f'{item.quantity} x {name}')
+
+    return {
+        'id': order.id,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'user_email': email,
+        'payment_status': order.payment_status,
+        'payment_method': order.payment_method,
+        'total_amount': order.total_amount,
+        'shipping_address': order.shipping_address,
+        'shipping_city': order.shipping_city,
+        'shipping_state': order.shipping_state,
+        'shipping_pincode': order.shipping_pincode,
+        'items': '; '.join(items)
+    }
 
 
 # Add this function to get similar wildlife in wildlife_detail route
-def get_similar_wildlife(category, exclude_id, limit=3):
+def get_similar_wildlife(animal, limit=3):
+    similar = recommendations.similar('wildlife', animal.id, limit)
+    if similar is not None:
+        return similar
+
+    # Not indexed yet (just added, or the index is still being built); fall
+    # back to the same category
     return Wildlife.query.filter(
-        Wildlife.category == category,
-        Wildlife.id != exclude_id
+        Wildlife.category == animal.category,
+        Wildlife.id != animal.id
     ).limit(limit).all()
 #-----------------------------end
 #---------------------------start(safari detail)
-@app.route('/safari/<int:id>')
+@bp.route('/safari/<int:id>')
 def safari_detail(id):
     """Safari package detail page"""
-    safari = Safari.query.get_or_404(id)
-
-    # Get similar safaris (same tier)
-    similar_safaris = Safari.query.filter(
-        Safari.tier == safari.tier,
-        Safari.id != safari.id
-    ).limit(3).all()
+    safari = catalog_cache.get_or_load(
+        ('safari', id), lambda: db.session.get(Safari, id), tags=row_tags('safari', id)
+    )
+    if safari is None:
+        abort(404)
+
+    # Get similar safaris (precomputed, by description and tier)
+    similar_safaris = recommendations.similar('safari', safari.id)
+    if similar_safaris is None:
+        # Not indexed yet (just added, or the index is still being built); fall
+        # back to the same tier
+        similar_safaris = Safari.query.filter(
+            Safari.tier == safari.tier,
+            Safari.id != safari.id
+        ).limit(3).all()
 
     # Pass today's date for the booking form
     today = datetime.now().strftime('%Y-%m-%d')
@@ -564,9 +889,39 @@ def safari_detail(id):
                            safari=safari,
                            similar_safaris=similar_safaris,
                            today=today)
+
+
+@bp.route('/safari/<int:id>/hold', methods=['POST'])
+@login_required
+def hold_safari_seats(id):
+    """Hold seats on a date for the user's cart (JSON or form: date, persons)"""
+    if db.session.get(Safari, id) is None:
+        return jsonify({'success': False, 'message': 'Safari not found'}), 404
+
+    data = request.get_json(silent=True) or request.form
+    try:
+        day = date.fromisoformat(data.get('date') or '')
+        seats = int(data.get('persons') or 1)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Choose a date and the number of persons'}), 400
+
+    try:
+        hold = hold_seats(current_user.id, id, day, seats)
+        db.session.commit()
+    except InventoryError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 409 if isinstance(e, SoldOut) else 400
+
+    return jsonify({
+        'success': True,
+        'message': f'{seats} seats held for you until {hold.expires_at:%H:%M}',
+        'hold_id': hold.id,
+        'expires_at': hold.expires_at.isoformat(timespec='seconds'),
+        'cart_url': url_for('main.view_cart')
+    })
 #----------------------------end(safari detail)
 
-@app.route('/admin/wildlife/delete/<int:id>', methods=['POST'])
+@bp.route('/admin/wildlife/delete/<int:id>', methods=['POST'])
 @login_required
 def delete_wildlife(id):
     if not current_user.is_admin:
@@ -574,51 +929,353 @@ def delete_wildlife(id):
 
     wildlife = Wildlife.query.get_or_404(id)
 
-    if wildlife.image_url and wildlife.image_url != 'default-wildlife.jpg':
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], wildlife.image_url)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-
+    image = wildlife.image_url
     db.session.delete(wildlife)
+    if image and image != 'default-wildlife.jpg':
+        enqueue('release_image', {'filename': image})
     db.session.commit()
 
     return jsonify({'success': True, 'message': 'Wildlife deleted successfully'})
 
 
-@app.route('/profile')
+#---------------------------start(json api)
+@bp.route('/api/wildlife')
+def api_wildlife_list():
+    """Wildlife as JSON, one cursor page at a time"""
+    return conditional_json(*list_page('wildlife'))
+
+
+@bp.route('/api/wildlife/<int:id>')
+def api_wildlife_detail(id):
+    animal = catalog_cache.get_or_load(
+        ('wildlife', id), lambda: db.session.get(Wildlife, id), tags=row_tags('wildlife', id)
+    )
+    if animal is None:
+        return jsonify({'success': False, 'message': 'Wildlife not found'}), 404
+    return conditional_json(*detail('wildlife', animal))
+
+
+@bp.route('/api/safaris')
+def api_safari_list():
+    """Safaris as JSON, one cursor page at a time"""
+    return conditional_json(*list_page('safari'))
+
+
+@bp.route('/api/safaris/<int:id>')
+def api_safari_detail(id):
+    safari = catalog_cache.get_or_load(
+        ('safari', id), lambda: db.session.get(Safari, id), tags=row_tags('safari', id)
+    )
+    if safari is None:
+        return jsonify({'success': False, 'message': 'Safari not found'}), 404
+    return conditional_json(*detail('safari', safari))
+
+
+@bp.route('/api/safaris/<int:id>/availability')
+def api_safari_availability(id):
+    """Seats left on each day of ?month=YYYY-MM (this month by default)"""
+    safari = catalog_cache.get_or_load(
+        ('safari', id), lambda: db.session.get(Safari, id), tags=row_tags('safari', id)
+    )
+    if safari is None:
+        return jsonify({'success': False, 'message': 'Safari not found'}), 404
+
+    month = request.args.get('month') or date.today().strftime('%Y-%m')
+    try:
+        year, month_number = map(int, month.split('-'))
+        days = availability.month(id, year, month_number)
+    except ValueError:
+        raise APIError('month must look like 2025-01')
+
+    return jsonify({
+        'safari_id': id,
+        'month': f'{year:04d}-{month_number:02d}',
+        'days': [{'date': day.isoformat(), 'seats_left': seats} for day, seats in days],
+    })
+
+
+@bp.app_errorhandler(APIError)
+def api_error(error):
+    return jsonify({'success': False, 'message': error.message}), error.status
+#----------------------------end(json api)
+
+@bp.route('/admin/cache')
+@login_required
+def cache_stats():
+    """Catalog, fragment and page cache hit/miss statistics, for sizing the caches"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    return jsonify({
+        'success': True,
+        'catalog_cache': catalog_cache.stats(),
+        'fragment_cache': current_app.jinja_env.fragment_cache.stats(),
+        'page_cache': page_cache.stats(),
+    })
+
+
+@bp.route('/admin/metrics')
+@login_required
+def metrics():
+    """Per-endpoint request, query and template timings in the Prometheus text format"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+
+    return Response(request_metrics.expose(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/profile')
 @login_required
 def profile():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+    # The page shows each order's item count; load the items with the orders
+    orders = Order.query.filter_by(user_id=current_user.id).options(selectinload(Order.items)) \
+        .order_by(Order.created_at.desc()).all()
     return render_template('profile.html', orders=orders)
 
 
-@app.route('/about')
+@bp.route('/healthz')
+def healthz():
+    """Liveness: the process is up and answering requests"""
+    return jsonify({'status': 'ok'})
+
+
+@bp.route('/readyz')
+def readyz():
+    """Readiness: the worker has warmed up and the database answers"""
+    if current_app.extensions.get('warmed_up') is False:
+        return jsonify({'status': 'warming up'}), 503
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError:
+        db.session.rollback()
+        return jsonify({'status': 'database unavailable'}), 503
+    return jsonify({'status': 'ready'})
+
+
+@bp.route('/about')
 def about():
     return render_template('about.html')
 
 
-@app.route('/contact')
+@bp.route('/contact')
 def contact():
     return render_template('contact.html')
 
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     db.session.rollback()
     return render_template('errors/500.html'), 500
 
 
+@bp.cli.command('backfill-images')
+@click.option('--force', is_flag=True, help='Regenerate derivatives that already exist.')
+@click.option('--workers', default=4, show_default=True, help='Number of parallel workers.')
+def backfill_images(force, workers):
+    """Create resized derivatives for every image already in the upload folder"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    filenames = sorted(
+        name for name in os.listdir(upload_folder)
+        if os.path.isfile(os.path.join(upload_folder, name))
+    )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda name: generate_derivatives(upload_folder, name, force), filenames)
+        written = skipped = 0
+        for name, result in zip(filenames, results):
+            if result is None:
+                skipped += 1
+                click.echo(f'Skipped {name} (not an image)')
+            else:
+                written += result
+
+    click.echo(f'Wrote {written} derivatives for {len(filenames) - skipped} images')
+
+
+@bp.cli.command('worker')
+@click.option('--concurrency', type=int, help='Jobs to run at once (default JOB_WORKER_THREADS).')
+@click.option('--type', 'types', multiple=True, help='Only run jobs of this type (repeatable).')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def worker(concurrency, types, burst):
+    """Run queued background jobs (image resizing, image cleanup, payments)"""
+    Worker(current_app._get_current_object(), concurrency=concurrency, types=types or None).run(burst=burst)
+    for job_type, counts in sorted(queue_stats().items()):
+        click.echo(f"{job_type}: {', '.join(f'{n} {status}' for status, n in sorted(counts.items()))}")
+
+
+@bp.cli.command('sweep-holds')
+def sweep_holds():
+    """Release seat holds that have expired (workers also do this every minute)"""
+    released = sweep_expired_holds()
+    db.session.commit()
+    click.echo(f'Released {released} expired holds')
+
+
+@bp.cli.command('set-capacity')
+@click.argument('safari_id', type=int)
+@click.argument('seats', type=click.IntRange(0))
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First date (default today).')
+@click.option('--days', default=1, show_default=True, help='Number of consecutive dates.')
+def set_capacity_command(safari_id, seats, start, days):
+    """Set how many seats a safari has on a run of dates"""
+    if db.session.get(Safari, safari_id) is None:
+        raise click.ClickException(f'No safari with id {safari_id}')
+    skipped = set_capacity(safari_id, start.date() if start else date.today(), days, seats)
+    db.session.commit()
+    for day in skipped:
+        click.echo(f'{day}: more than {seats} seats already booked, left unchanged', err=True)
+    click.echo(f'Set {days - len(skipped)} dates to {seats} seats')
+
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Write content-hashed, precompressed copies of the static files for production"""
+    manifest = build_assets(current_app.static_folder, current_app.config['ASSET_OUTPUT_DIR'])
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f'{name} -> {hashed}')
+    click.echo(f'Built {len(manifest)} assets; restart the app to serve them')
+
+
+@bp.cli.command('init-db')
+@click.option('--sample-data/--no-sample-data', default=True, show_default=True,
+              help='Add the admin user and sample catalog if they are missing.')
+def init_db(sample_data):
+    """Create or upgrade the schema and search index, and seed the database; run once per deploy"""
+    applied = upgrade_database()
+    if search_index_supported():
+        init_search_index()
+    if sample_data:
+        create_sample_data()
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+    click.echo(f"Schema at version {version}{f' (applied {applied})' if applied else ''}"
+               f"{', sample data checked' if sample_data else ''}")
+
+
+@bp.cli.command('serve')
+@click.option('--bind', help='Address to listen on (default SERVER_BIND).')
+@click.option('--workers', type=int, help='Worker processes (default SERVER_WORKERS, or 2 x CPUs + 1).')
+@click.option('--threads', type=int, help='Threads per worker (default SERVER_THREADS).')
+@click.option('--max-requests', type=int, help='Requests before a worker is replaced; 0 never (default SERVER_MAX_REQUESTS).')
+def serve_command(bind, workers, threads, max_requests):
+    """Serve the app with pre-forked, warmed-up workers (Linux/macOS; needs gunicorn)
+
+    kill -HUP the master to replace workers gracefully; run `flask init-db`
+    first and `flask worker` alongside for background jobs.
+    """
+    try:
+        from server import serve, default_workers
+    except ImportError as e:
+        raise click.ClickException(f'flask serve needs gunicorn ({e})')
+
+    config = current_app.config
+    serve(current_app._get_current_object(),
+          bind=bind or config['SERVER_BIND'],
+          workers=workers or config['SERVER_WORKERS'] or default_workers(),
+          threads=threads or config['SERVER_THREADS'],
+          max_requests=config['SERVER_MAX_REQUESTS'] if max_requests is None else max_requests,
+          max_requests_jitter=config['SERVER_MAX_REQUESTS_JITTER'],
+          timeout=config['SERVER_TIMEOUT'],
+          graceful_timeout=config['SERVER_GRACEFUL_TIMEOUT'])
+
+
+@bp.cli.command('profile-startup')
+@click.option('--path', 'paths', multiple=True, default=['/', '/wildlife', '/safaris'], show_default=True,
+              help='Page to request after start-up; repeat for several.')
+@click.option('--top', default=15, show_default=True, help='Modules to list, slowest first.')
+@click.option('--no-bytecode-cache', is_flag=True, help='Compile templates from source, for comparison.')
+def profile_startup_command(paths, top, no_bytecode_cache):
+    """Start the app in a fresh process and report import, init and first-response times"""
+    from startup import profile_startup
+
+    env = {'TEMPLATE_BYTECODE_CACHE': ''} if no_bytecode_cache else {}
+    try:
+        report = profile_startup(current_app.root_path, paths, env)
+    except RuntimeError as e:
+        raise click.ClickException(f'The app failed to start: {e}')
+
+    click.echo(f"{'module':<24}{'self ms':>10}{'total ms':>10}")
+    imports = sorted(report['imports'].items(), key=lambda item: item[1][1], reverse=True)
+    for name, (own, total, local) in imports[:top]:
+        click.echo(f"{name + (' *' if local else ''):<24}{own * 1000:>10.1f}{total * 1000:>10.1f}")
+    click.echo(f"(* this app's modules)\n\nimport app.py: {report['import'] * 1000:.1f} ms, of which create_app:")
+    for name, seconds in report['init']:
+        click.echo(f'  {name:<22}{seconds * 1000:>10.1f} ms')
+    click.echo(f"\n{'page':<24}{'status':>8}{'first ms':>10}{'next ms':>10}")
+    for path, status, first, second in report['responses']:
+        click.echo(f'{path:<24}{status:>8}{first * 1000:>10.1f}{second * 1000:>10.1f}')
+    click.echo(f"\nTime to first response: {(report['import'] + report['responses'][0][2]) * 1000:.1f} ms")
+
+
+@bp.cli.command('upgrade-db')
+def upgrade_db():
+    """Create missing tables and apply pending schema migrations"""
+    applied = upgrade_database()
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+    if applied:
+        click.echo(f"Applied migrations {', '.join(map(str, applied))}; schema is at version {version}")
+    else:
+        click.echo(f'Schema is up to date at version {version}')
+
+
+@bp.cli.command('reconcile-stats')
+def reconcile_stats():
+    """Recount wildlife, safaris, orders and users for the dashboard counters"""
+    for name, value in reconcile_counters().items():
+        click.echo(f'{name}: {value}')
+
+
+@bp.cli.command('import-catalog')
+@click.argument('catalog', type=click.Choice(list(CATALOGS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(FORMATS), help='Input format; guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True, help='Records per transaction.')
+@click.option('--resume', is_flag=True, help='Skip the records an earlier, failed run already committed.')
+@click.option('--max-errors', default=100, show_default=True, help='Invalid records to skip before giving up.')
+def import_catalog_command(catalog, path, format, batch_size, resume, max_errors):
+    """Load wildlife or safaris from a CSV or JSON lines file, updating rows that already exist"""
+    def progress(records, inserted, updated):
+        click.echo(f'{records} records read, {inserted} inserted, {updated} updated', err=True)
+
+    try:
+        result = import_catalog(catalog, path, format, batch_size, resume, max_errors, progress)
+    except RowError as e:
+        raise click.ClickException(f'{e}. Fix the file and rerun with --resume.')
+
+    for number, message in result.errors:
+        click.echo(f'Record {number}: {message}', err=True)
+    if result.resumed_from:
+        click.echo(f'Resumed after record {result.resumed_from}')
+    click.echo(f'Inserted {result.inserted}, updated {result.updated}, rejected {result.rejected}')
+
+
+@bp.cli.command('export-catalog')
+@click.argument('catalog', type=click.Choice(list(CATALOGS)))
+@click.argument('path', default='-', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', type=click.Choice(FORMATS), help='Output format; guessed from the file extension by default.')
+def export_catalog_command(catalog, path, format):
+    """Write all wildlife or safaris to a CSV or JSON lines file (stdout by default)"""
+    format = format or ('csv' if path == '-' else detect_format(path))
+    if path == '-':
+        count = export_catalog(catalog, click.get_text_stream('stdout'), format)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            count = export_catalog(catalog, f, format)
+    click.echo(f'Exported {count} {catalog} rows', err=True)
+
+
 def create_sample_data():
     # Create admin user
-    if not User.query.filter_by(email='admin@wildlife.com').first():
+    if not User.query.filter_by(email=current_app.config['ADMIN_EMAIL']).first():
         admin = User(
-            email='admin@wildlife.com',
-            password=generate_password_hash('admin123'),
+            email=current_app.config['ADMIN_EMAIL'],
+            password=passwords.hash(current_app.config['ADMIN_PASSWORD']),
             is_admin=True
         )
         db.session.add(admin)
@@ -693,8 +1350,10 @@ def create_sample_data():
     db.session.commit()
 
 
+app = create_app()
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        create_sample_data()
+    # Development server: run `flask init-db` once first, and `flask serve` in production.
+    # It runs queued jobs itself; deployments run `flask worker`
+    Worker(app).start()
     app.run(debug=False)
\ No newline at end of file
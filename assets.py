@@ -0,0 +1,177 @@
+# assets.py - Fingerprinted, precompressed static assets
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+import posixpath
+
+from flask import current_app, request, send_file, send_from_directory, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # .br files are skipped without it
+    brotli = None
+
+from storage import IMMUTABLE_CACHE_CONTROL
+
+HASH_LENGTH = 12
+
+# Files worth compressing ahead of time; images and fonts already are
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.xml', '.map', '.ico', '.html'}
+
+# (Accept-Encoding token, file suffix), best first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def _fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def _hashed_name(name, data):
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{_fingerprint(data)}{ext}'
+
+
+def _write_variants(path, data):
+    """Write path plus .gz and .br copies when they are worth having; returns the suffixes written"""
+    with open(path, 'wb') as f:
+        f.write(data)
+    written = []
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE:
+        return written
+
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    for suffix, compressed in variants.items():
+        # Not worth the Content-Encoding negotiation for a tiny saving
+        if len(compressed) < len(data) * 0.9:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(suffix)
+    return written
+
+
+def _rewrite_css_urls(css, name, manifest, output_dir):
+    """Point relative url()s in a stylesheet at the hashed files, from where the stylesheet will live"""
+    source_dir = posixpath.dirname(name)
+    target_dir = posixpath.dirname(posixpath.join(output_dir, name))
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url, re.I):
+            return match.group(0)
+        path, _, suffix = url.partition('?')
+        logical = posixpath.normpath(posixpath.join(source_dir, path))
+        new_path = posixpath.relpath(manifest.get(logical, logical), target_dir)
+        return f"url({quote}{new_path}{'?' + suffix if suffix else ''}{quote})"
+
+    return CSS_URL.sub(replace, css)
+
+
+def build_assets(static_folder, output_dir='dist', exclude=('uploads',)):
+    """Copy every static file to output_dir under a content-hashed name with compressed variants.
+
+    Writes output_dir/manifest.json mapping logical names (css/style.css)
+    to hashed ones (dist/css/style.1a2b3c4d5e6f.css) and returns it.
+    Stylesheets go last so their url()s can point at hashed files. Files
+    from earlier builds are kept, so cached pages that still link to them
+    keep working; delete output_dir to start over.
+    """
+    output_path = os.path.join(static_folder, output_dir)
+    skip = {output_dir, *exclude}
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        relative_root = os.path.relpath(root, static_folder)
+        if relative_root == '.':
+            dirs[:] = [d for d in dirs if d not in skip]
+        for filename in files:
+            if not filename.startswith('.'):
+                name = os.path.normpath(os.path.join(relative_root, filename)).replace(os.sep, '/')
+                sources.append(name)
+    sources.sort(key=lambda name: (name.endswith('.css'), name))
+
+    manifest = {}
+    for name in sources:
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            data = f.read()
+        if name.endswith('.css'):
+            data = _rewrite_css_urls(data.decode('utf-8'), name, manifest, output_dir).encode('utf-8')
+
+        hashed = _hashed_name(name, data)
+        target = os.path.join(output_path, hashed)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write_variants(target, data)
+        manifest[name] = f'{output_dir}/{hashed}'
+
+    # Replace the manifest in one step; running processes read it at startup
+    manifest_path = os.path.join(output_path, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return manifest
+
+
+class StaticAssets:
+    """Serves the output of build_assets.
+
+    With a manifest, url_for('static', filename='css/style.css') returns the
+    hashed name, and hashed files are sent with a year-long immutable
+    Cache-Control in the best encoding the client accepts (.br, then .gz,
+    then as is) via send_file, which uses the server's file wrapper or
+    X-Sendfile (USE_X_SENDFILE) where available. Without one (the
+    development config, or before the first build) static files are served
+    from their own names as usual.
+    """
+
+    def __init__(self):
+        self.manifest = {}
+        self.prefix = 'dist/'
+
+    def init_app(self, app):
+        self.manifest = {}
+        self.prefix = app.config.get('ASSET_OUTPUT_DIR', 'dist') + '/'
+        manifest_path = app.config.get('ASSET_MANIFEST')
+        if manifest_path and os.path.isfile(os.path.join(app.static_folder, manifest_path)):
+            with open(os.path.join(app.static_folder, manifest_path)) as f:
+                self.manifest = json.load(f)
+
+        app.url_defaults(self.hashed_url)
+        app.view_functions['static'] = self.send_static
+        app.extensions['static_assets'] = self
+
+    def hashed_url(self, endpoint, values):
+        if endpoint == 'static' and self.manifest:
+            filename = values.get('filename')
+            if filename in self.manifest:
+                values['filename'] = self.manifest[filename]
+
+    def send_static(self, filename):
+        app = current_app
+        if not filename.startswith(self.prefix):
+            return app.send_static_file(filename)
+
+        path = safe_join(app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and os.path.isfile(path + suffix):
+                response = send_file(path + suffix, mimetype=mimetype, max_age=31536000)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename, max_age=31536000)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+static_assets = StaticAssets()
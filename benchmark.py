@@ -0,0 +1,447 @@
+# benchmark.py - Route benchmarks against synthetic datasets
+"""Drive every route through the Flask test client and report, per route,
+latency percentiles, SQL query count and peak Python memory.
+
+    python benchmark.py --size 1k
+    python benchmark.py --size 10k --iterations 50 --only wildlife_gallery
+    python benchmark.py --size 1k --update-baseline
+
+Exits non-zero when a route runs more queries than its budget below, or
+its median latency is more than --tolerance times the one recorded in
+benchmark_baseline.json for the same dataset size. Baselines are machine
+specific; refresh them with --update-baseline when the hardware changes.
+
+Each run builds a fresh SQLite database in a temporary directory.
+Passwords are hashed with a low cost so the login routes measure the
+application, not PBKDF2. Upload routes are benchmarked as GET forms only.
+The page, catalog, fragment, user and availability caches are switched
+off, so every request runs its queries and budgets measure the uncached path; a warm cache
+would hide an N+1 regression behind a count of 0.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Products in the catalog; users and orders scale with it
+SIZES = {
+    '1k': 1000,
+    '10k': 10000,
+    '100k': 100000,
+}
+
+CATEGORIES = ['Big Cats', 'Birds', 'Reptiles', 'Primates', 'Marine', 'Herbivores']
+TIERS = ['Basic', 'Standard', 'Premium', 'Luxury']
+WORDS = '''
+    tiger leopard elephant rhino forest river valley mountain grassland wetland
+    night trail jeep canopy monsoon winter summer sighting guide lodge camp
+    himalayan desert mangrove delta plateau reserve sanctuary migration herd
+'''.split()
+INSERT_BATCH = 5000
+
+
+class Route:
+    """One benchmarked request; url and setup may use the dataset's ids"""
+
+    def __init__(self, name, url, client='anon', method='get', budget=5, setup=None, **kwargs):
+        self.name = name
+        self.url = url
+        self.client = client
+        self.method = method
+        self.budget = budget
+        self.setup = setup
+        self.kwargs = kwargs
+
+
+def _fill_cart(bench):
+    for product_id, product_type in bench.cart_products:
+        bench.clients['user'].post('/cart/add', json={'product_id': product_id, 'product_type': product_type})
+    return {}
+
+
+def _new_wildlife(bench):
+    from models import db, Wildlife
+    with bench.app.app_context():
+        wildlife = Wildlife(title='Benchmark', description='Deleted by the benchmark', price=1,
+                            category=CATEGORIES[0], image_url='default-wildlife.jpg')
+        db.session.add(wildlife)
+        db.session.commit()
+        return {'id': wildlife.id}
+
+
+def _new_hold_date(bench):
+    # A different date each time, so the route never runs out of seats
+    bench.holds += 1
+    return {'day': (datetime.now().date() + timedelta(days=bench.holds % 300 + 1)).isoformat()}
+
+
+def _new_hold(bench):
+    response = bench.clients['user'].post(f"/safari/{bench.params['safari_id']}/hold",
+                                          json={'date': _new_hold_date(bench)['day'], 'persons': 1})
+    return {'hold_id': response.get_json()['hold_id']}
+
+
+def _new_email(bench):
+    bench.registered += 1
+    return {'n': bench.registered}
+
+
+# Query budgets are per request and must not grow with the dataset size
+ROUTES = [
+    Route('index', '/', budget=2),
+    Route('wildlife_gallery', '/wildlife', budget=2),
+    Route('wildlife_gallery (search)', '/wildlife?q=tiger+forest', budget=2),
+    Route('wildlife_gallery (category)', '/wildlife?category=Birds&page=2', budget=2),
+    # Detail pages run one more query every SIMILAR_ITEMS_CHECK_SECONDS
+    Route('wildlife_detail', '/wildlife/{wildlife_id}', budget=2),
+    Route('safari_packages', '/safaris', budget=1),
+    Route('safari_detail', '/safari/{safari_id}', budget=2),
+    Route('api_wildlife_list', '/api/wildlife?category=Birds&fields=title,price', budget=2),
+    Route('api_wildlife_list (not modified)', '/api/wildlife', budget=1, headers={'If-None-Match': '*'}),
+    Route('api_wildlife_detail', '/api/wildlife/{wildlife_id}', budget=1),
+    Route('api_safari_list', '/api/safaris?cursor={safari_id}', budget=2),
+    Route('api_safari_detail', '/api/safaris/{safari_id}', budget=1),
+    Route('api_safari_availability', '/api/safaris/{safari_id}/availability', budget=2),
+    Route('healthz', '/healthz', budget=0),
+    Route('readyz', '/readyz', budget=1),
+    Route('about', '/about', budget=0),
+    Route('contact', '/contact', budget=0),
+    Route('login', '/login', budget=0),
+    Route('login POST', '/login', client='login', method='post', budget=1,
+          data={'email': 'bench@example.com', 'password': 'benchmark'}),
+    Route('register', '/register', budget=0),
+    Route('register POST', '/register', method='post', budget=3, setup=_new_email,
+          data={'email': 'bench-{n}@example.com', 'password': 'benchmark', 'confirm_password': 'benchmark'}),
+    Route('view_cart', '/cart', client='user', budget=5),
+    Route('add_to_cart', '/cart/add', client='user', method='post', budget=5,
+          json={'product_id': '{wildlife_id}', 'product_type': 'wildlife'}),
+    Route('update_cart_item', '/cart/update/{cart_item_id}', client='user', method='post', budget=4,
+          data={'action': 'increase'}),
+    Route('cart_batch', '/cart/batch', client='user', method='post', budget=13,
+          json={'operations': [{'op': 'add', 'product_type': 'wildlife', 'product_id': '{wildlife_id}', 'quantity': 3},
+                               {'op': 'add', 'product_type': 'safari', 'product_id': '{safari_id}'},
+                               {'op': 'set', 'item_id': '{cart_item_id}', 'quantity': 2}]}),
+    Route('checkout', '/checkout', client='user', budget=5, setup=_fill_cart),
+    Route('checkout POST', '/checkout', client='user', method='post', budget=12, setup=_fill_cart,
+          data={'address': '1 Forest Road', 'city': 'Nagpur', 'state': 'MH', 'pincode': '440001'}),
+    Route('order_summary', '/order/summary', client='user', budget=5),
+    Route('my_orders', '/my-orders', client='user', budget=5),
+    Route('profile', '/profile', client='user', budget=3),
+    Route('hold_safari_seats', '/safari/{safari_id}/hold', client='user', method='post', budget=7,
+          setup=_new_hold_date, json={'date': '{day}', 'persons': 1}),
+    Route('remove_seat_hold', '/cart/hold/{hold_id}/remove', client='user', method='post', budget=4,
+          setup=_new_hold),
+    Route('admin_dashboard', '/admin', client='admin', budget=2),
+    Route('manage_wildlife', '/admin/wildlife', client='admin', budget=2),
+    Route('manage_safaris', '/admin/safaris', client='admin', budget=2),
+    Route('add_wildlife', '/admin/wildlife/add', client='admin', budget=1),
+    Route('edit_wildlife', '/admin/wildlife/edit/{wildlife_id}', client='admin', budget=2),
+    Route('add_safari', '/admin/safari/add', client='admin', budget=1),
+    Route('view_orders', '/admin/orders', client='admin', budget=6),
+    Route('view_orders (next page)', '/admin/orders?cursor={order_cursor}', client='admin', budget=6),
+    # Streams EXPORT_BATCH_SIZE orders per query; the 10k dataset's month is two batches
+    Route('export_orders', '/admin/orders/export?format=csv&date_from={export_from}', client='admin', budget=8),
+    Route('cache_stats', '/admin/cache', client='admin', budget=1),
+    Route('metrics', '/admin/metrics', client='admin', budget=1),
+    Route('delete_wildlife', '/admin/wildlife/delete/{id}', client='admin', method='post', budget=6,
+          setup=_new_wildlife),
+]
+
+
+def _format(value, params):
+    if isinstance(value, str):
+        return value.format(**params)
+    if isinstance(value, dict):
+        return {key: _format(item, params) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_format(item, params) for item in value]
+    return value
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def build_dataset(app, products, seed=0):
+    """Seed the database with products, users and orders; returns ids the routes use"""
+    from sqlalchemy import insert
+    from models import db, User, Wildlife, Safari, Order, OrderItem
+    from stats import reconcile_counters
+    from passwords import passwords
+
+    rng = random.Random(seed)
+    n_wildlife = products * 4 // 5
+    n_safari = products - n_wildlife
+    n_users = max(10, products // 20)
+    n_orders = products
+    now = datetime.now()
+
+    def insert_batches(model, rows):
+        for start in range(0, len(rows), INSERT_BATCH):
+            db.session.execute(insert(model), rows[start:start + INSERT_BATCH])
+
+    with app.app_context():
+        insert_batches(Wildlife, [{
+            'title': f'{rng.choice(WORDS).title()} {rng.choice(WORDS)} {i}',
+            'description': _text(rng, 30),
+            'image_url': 'default-wildlife.jpg',
+            'category': rng.choice(CATEGORIES),
+            'price': rng.randint(500, 50000),
+            'location': rng.choice(WORDS).title(),
+        } for i in range(n_wildlife)])
+        insert_batches(Safari, [{
+            'name': f'{rng.choice(WORDS).title()} Safari {i}',
+            'description': _text(rng, 30),
+            'price': rng.randint(2000, 200000),
+            'duration': f'{rng.randint(1, 10)} days',
+            'safari_count': rng.randint(1, 12),
+            'tier': rng.choice(TIERS),
+            'image_url': 'default-safari.jpg',
+        } for i in range(n_safari)])
+
+        # Every synthetic user shares one hash; only bench@example.com logs in
+        password = passwords.hash('benchmark')
+        insert_batches(User, [{
+            'email': 'bench@example.com' if i == 0 else f'user-{i}@example.com',
+            'password': password,
+            'created_at': now - timedelta(days=rng.randint(0, 365)),
+        } for i in range(n_users)])
+        bench_user = User.query.filter_by(email='bench@example.com').one()
+        first_user = bench_user.id
+
+        wildlife_ids = db.session.scalars(db.select(Wildlife.id)).all()
+        safari_ids = db.session.scalars(db.select(Safari.id)).all()
+        insert_batches(Order, [{
+            # The benchmark user gets a handful of orders, like a regular customer
+            'user_id': first_user if i % 500 == 0 else first_user + rng.randrange(n_users),
+            'total_amount': 0,
+            'payment_status': rng.choice(['pending', 'completed', 'failed']),
+            'payment_method': 'card',
+            'shipping_address': _text(rng, 3),
+            'shipping_city': rng.choice(WORDS).title(),
+            'created_at': now - timedelta(minutes=rng.randint(0, 525600)),
+        } for i in range(n_orders)])
+
+        order_ids = db.session.scalars(db.select(Order.id)).all()
+        items = []
+        for order_id in order_ids:
+            for _ in range(rng.randint(1, 4)):
+                product_type = 'safari' if rng.random() < 0.3 else 'wildlife'
+                items.append({
+                    'order_id': order_id,
+                    'product_type': product_type,
+                    'product_id': rng.choice(safari_ids if product_type == 'safari' else wildlife_ids),
+                    'quantity': rng.randint(1, 3),
+                    'price': rng.randint(500, 50000),
+                })
+        insert_batches(OrderItem, items)
+        db.session.commit()
+        reconcile_counters()
+
+        second_page = Order.query.order_by(Order.created_at.desc(), Order.id.desc()).offset(49).first()
+        return {
+            'wildlife_id': wildlife_ids[len(wildlife_ids) // 2],
+            'safari_id': safari_ids[len(safari_ids) // 2],
+            'order_cursor': f'{second_page.created_at.isoformat()}_{second_page.id}',
+            # Roughly a month of orders
+            'export_from': (now - timedelta(days=30)).strftime('%Y-%m-%d'),
+            'cart_products': [(wildlife_ids[i], 'wildlife') for i in range(3)] +
+                             [(safari_ids[i], 'safari') for i in range(2)],
+        }
+
+
+class Bench:
+    def __init__(self, app, params):
+        self.app = app
+        self.params = params
+        self.cart_products = params.pop('cart_products')
+        self.registered = 0
+        self.holds = 0
+        self.queries = 0
+
+        from sqlalchemy import event
+        from models import db
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count_query)
+
+        self.clients = {name: app.test_client() for name in ('anon', 'login', 'user', 'admin')}
+        self._login('user', 'bench@example.com', 'benchmark')
+        self._login('admin', app.config['ADMIN_EMAIL'], app.config['ADMIN_PASSWORD'])
+
+        # A cart to look at, and an order for order_summary
+        _fill_cart(self)
+        self.clients['user'].post('/checkout', data={'address': 'x'})
+        _fill_cart(self)
+        from models import CartItem
+        with app.app_context():
+            self.params['cart_item_id'] = CartItem.query.filter_by(product_type='wildlife').first().id
+
+    def _count_query(self, *args):
+        self.queries += 1
+
+    def _login(self, client, email, password):
+        response = self.clients[client].post('/login', data={'email': email, 'password': password})
+        if response.status_code != 302:
+            raise RuntimeError(f'Could not log in as {email}')
+
+    def request(self, route):
+        params = dict(self.params)
+        if route.setup:
+            params.update(route.setup(self))
+        kwargs = _format(route.kwargs, params)
+        if 'json' in kwargs:
+            # JSON ids must stay numbers
+            kwargs['json'] = {k: int(v) if k.endswith('_id') else v for k, v in kwargs['json'].items()}
+        client = self.clients[route.client]
+
+        self.queries = 0
+        started = time.perf_counter()
+        response = getattr(client, route.method)(route.url.format(**params), **kwargs)
+        response.get_data()  # consume streamed bodies inside the timing
+        elapsed = time.perf_counter() - started
+        response.close()
+
+        if response.status_code >= 400:
+            raise RuntimeError(f'{route.name}: HTTP {response.status_code}')
+        return elapsed, self.queries
+
+    def run(self, route, iterations, warmup):
+        for _ in range(warmup):
+            self.request(route)
+
+        # Like timeit, keep garbage collection pauses out of the timings
+        gc.collect()
+        gc.disable()
+        timings = []
+        queries = 0
+        try:
+            for _ in range(iterations):
+                elapsed, count = self.request(route)
+                timings.append(elapsed * 1000)
+                queries = max(queries, count)
+        finally:
+            gc.enable()
+
+        # Memory is measured on a separate run; tracing slows everything down
+        tracemalloc.start()
+        self.request(route)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries': queries,
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def check(route, result, baseline, tolerance, slack_ms):
+    """Problems with a route's result, as a list of messages"""
+    problems = []
+    if result['queries'] > route.budget:
+        problems.append(f"{result['queries']} queries, budget is {route.budget}")
+    if baseline:
+        # The median, as one outlier decides p95 on a couple dozen samples
+        limit = baseline['p50_ms'] * tolerance + slack_ms
+        if result['p50_ms'] > limit:
+            problems.append(f"p50 {result['p50_ms']:.1f}ms, baseline {baseline['p50_ms']:.1f}ms")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route against a synthetic dataset.')
+    parser.add_argument('--size', choices=SIZES, default='1k')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', action='append', help='Benchmark only this route (repeatable).')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Record this run as the baseline for its size.')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Allowed median slowdown over the baseline, as a ratio.')
+    parser.add_argument('--slack-ms', type=float, default=2.0,
+                        help='Allowed median slowdown in milliseconds, on top of the ratio.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='wildlife-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['SECRET_KEY'] = 'benchmark'
+    os.environ.setdefault('PASSWORD_HASH_COST', '1000')
+    # Measure the routes, not the caches; a cache hit runs no queries
+    os.environ['PAGE_CACHE_TTL'] = '0'
+    os.environ['CATALOG_CACHE_TTL'] = '0'
+    os.environ['FRAGMENT_CACHE_TTL'] = '0'
+    os.environ['USER_CACHE_TTL'] = '0'
+    os.environ['AVAILABILITY_TTL'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from app import create_app, create_sample_data
+    from migrations import upgrade_database
+    from search import init_search_index, search_index_supported
+
+    app = create_app()
+    started = time.perf_counter()
+    with app.app_context():
+        upgrade_database()
+        if search_index_supported():
+            init_search_index()
+        create_sample_data()
+    params = build_dataset(app, SIZES[args.size])
+    bench = Bench(app, params)
+    print(f'Built {args.size} dataset in {time.perf_counter() - started:.1f}s ({workdir})\n')
+
+    routes = [route for route in ROUTES if not args.only or route.name in args.only]
+    baselines = load_baseline(args.baseline)
+    baseline = baselines.get(args.size, {})
+
+    results = {}
+    failures = 0
+    print(f"{'route':32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'peak KiB':>9}")
+    for route in routes:
+        result = results[route.name] = bench.run(route, args.iterations, args.warmup)
+        problems = check(route, result, None if args.update_baseline else baseline.get(route.name),
+                         args.tolerance, args.slack_ms)
+        failures += bool(problems)
+        print(f"{route.name:32} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['p99_ms']:9.2f} "
+              f"{result['queries']:8} {result['peak_kib']:9.1f}"
+              + ('  FAIL: ' + '; '.join(problems) if problems else ''))
+
+    if args.update_baseline:
+        baselines[args.size] = {**baseline, **results}
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'\nBaseline for {args.size} written to {args.baseline}')
+
+    if failures:
+        print(f'\n{failures} route(s) over budget or slower than the baseline')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# cache.py - In-process read-through cache for catalog queries
+import time
+import threading
+from collections import OrderedDict
+
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, Wildlife, Safari
+
+# Models whose rows are cached, and the tag prefix used for each
+CACHED_MODELS = {
+    Wildlife: 'wildlife',
+    Safari: 'safari',
+}
+
+
+def list_tag(name):
+    """Tag for entries that depend on the whole table (lists, similar items)"""
+    return name
+
+
+def row_tags(name, id):
+    """Tags for an entry that depends on one row"""
+    return (f'{name}:{id}', f'{name}:*')
+
+
+class CatalogCache:
+    """Bounded LRU cache with a TTL, invalidated by tag.
+
+    Each entry is stored with the tags it depends on. Committing a change to a
+    cached model drops the entries tagged with that table and with the changed
+    row, and nothing else. Invalidation only reaches the process that made
+    the change; the TTL bounds staleness in other worker processes.
+    """
+
+    def __init__(self, max_entries=512, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._keys_by_tag = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, so a load that raced one isn't stored
+        self._generation = 0
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('CATALOG_CACHE_SIZE', self.max_entries)
+        self.ttl = app.config.get('CATALOG_CACHE_TTL', self.ttl)
+        app.extensions['catalog_cache'] = self
+
+        if not event.contains(Session, 'after_flush', _collect_changes):
+            event.listen(Session, 'after_flush', _collect_changes)
+            event.listen(Session, 'do_orm_execute', _collect_bulk_changes)
+            event.listen(Session, 'after_commit', _invalidate_changes)
+            event.listen(Session, 'after_rollback', _discard_changes)
+
+    def get_or_load(self, key, loader, tags=()):
+        """Return the cached value for key, calling loader() on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            generation = self._generation
+
+        value = _detach(loader())
+
+        with self._lock:
+            if self._generation != generation:
+                # The catalog changed while loading; the value may predate it
+                return value
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+catalog_cache = CatalogCache()
+
+
+def _detach(value):
+    """Take cached ORM objects out of the request session.
+
+    Detached objects keep their loaded attributes, and a later commit in the
+    session that loaded them can no longer expire them.
+    """
+    if isinstance(value, Pagination):
+        # Drop the query (and with it the session); only the results are cached
+        value._query_args = {}
+        _detach(value.items)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _detach(item)
+    elif type(value) in CACHED_MODELS and value in db.session:
+        db.session.expunge(value)
+    return value
+
+
+def _pending_tags(session):
+    return session.info.setdefault('catalog_cache_tags', set())
+
+
+def _collect_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        name = CACHED_MODELS.get(type(obj))
+        if name:
+            _pending_tags(session).update((list_tag(name), f'{name}:{obj.id}'))
+
+
+def _collect_bulk_changes(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    name = CACHED_MODELS.get(mapper.class_) if mapper is not None else None
+    if not name:
+        return
+    tags = _pending_tags(orm_execute_state.session)
+    tags.add(list_tag(name))
+    # Bulk UPDATE/DELETE statements can touch any row of the table; new rows
+    # only change the lists
+    if not orm_execute_state.is_insert:
+        tags.add(f'{name}:*')
+
+
+_commit_listeners = []
+
+
+def on_catalog_commit(listener):
+    """Register listener(tags) to run after a commit that changed the catalog"""
+    if listener not in _commit_listeners:
+        _commit_listeners.append(listener)
+    return listener
+
+
+def _invalidate_changes(session):
+    tags = session.info.pop('catalog_cache_tags', None)
+    if tags:
+        catalog_cache.invalidate(*tags)
+        for listener in _commit_listeners:
+            listener(tags)
+
+
+def _discard_changes(session):
+    session.info.pop('catalog_cache_tags', None)
@@ -0,0 +1,141 @@
+# cart.py - Cart contents and batched cart changes for /cart/batch
+from collections import namedtuple
+
+from flask import current_app
+
+from models import db, CartItem, Safari, PRODUCT_MODELS, load_products, product_for
+from identity import add_cart_item
+from inventory import active_holds
+
+# op is 'add' (by product_type and product_id), 'set' or 'remove' (by item_id)
+CartOperation = namedtuple('CartOperation', 'op product_type product_id item_id quantity')
+
+
+class CartError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _integer(data, name, default=None):
+    value = data.get(name, default)
+    if value is None or isinstance(value, bool):
+        raise ValueError(f'{name} is required')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a whole number')
+
+
+def parse_operations(raw):
+    """Validate the JSON operations of a batch; raises CartError"""
+    limit = current_app.config['CART_BATCH_LIMIT']
+    max_quantity = current_app.config['CART_MAX_QUANTITY']
+    if not isinstance(raw, list) or not raw:
+        raise CartError('operations must be a non-empty list')
+    if len(raw) > limit:
+        raise CartError(f'At most {limit} operations per request')
+
+    operations = []
+    for index, data in enumerate(raw):
+        try:
+            if not isinstance(data, dict):
+                raise ValueError('must be an object')
+            op = data.get('op')
+            if op == 'add':
+                if data.get('product_type') not in PRODUCT_MODELS:
+                    raise ValueError(f"product_type must be one of {', '.join(PRODUCT_MODELS)}")
+                quantity = _integer(data, 'quantity', 1)
+                if not 1 <= quantity <= max_quantity:
+                    raise ValueError(f'quantity must be between 1 and {max_quantity}')
+                operations.append(CartOperation(op, data['product_type'], _integer(data, 'product_id'), None, quantity))
+            elif op in ('set', 'remove'):
+                quantity = _integer(data, 'quantity') if op == 'set' else 0
+                if not 0 <= quantity <= max_quantity:
+                    raise ValueError(f'quantity must be between 0 and {max_quantity}')
+                # Setting a quantity of 0 removes the item
+                operations.append(CartOperation(op if quantity else 'remove', None, None, _integer(data, 'item_id'), quantity))
+            else:
+                raise ValueError('op must be add, set or remove')
+        except ValueError as e:
+            raise CartError(f'Operation {index + 1}: {e}')
+    return operations
+
+
+def apply_operations(user_id, operations):
+    """Apply parsed operations to a user's cart, in order, in the current transaction.
+
+    Adds use the atomic upsert of identity.add_cart_item; items named by
+    set and remove are loaded (and locked, where the database can) in one
+    query, and ones no longer in the cart are skipped. Raises CartError if
+    an added product doesn't exist; roll back then.
+    """
+    adds = [operation for operation in operations if operation.op == 'add']
+    products = load_products(adds)
+    for operation in adds:
+        if product_for(products, operation) is None:
+            raise CartError(f'{operation.product_type.title()} {operation.product_id} not found', 404)
+
+    item_ids = {operation.item_id for operation in operations if operation.op != 'add'}
+    items = {}
+    if item_ids:
+        items = {item.id: item for item in CartItem.query.filter(
+            CartItem.user_id == user_id, CartItem.id.in_(item_ids)
+        ).with_for_update().all()}
+    items_by_product = {(item.product_type, item.product_id): item for item in items.values()}
+
+    for operation in operations:
+        if operation.op == 'add':
+            # The upsert bypasses the ORM, so write pending changes first and
+            # reload the quantity afterwards (the cart counter works from it)
+            db.session.flush()
+            add_cart_item(user_id, operation.product_type, operation.product_id, operation.quantity)
+            item = items_by_product.get((operation.product_type, operation.product_id))
+            if item is not None:
+                db.session.refresh(item, ['quantity'])
+        elif operation.item_id in items:
+            item = items[operation.item_id]
+            if operation.op == 'remove':
+                db.session.delete(item)
+                del items[operation.item_id]
+                del items_by_product[(item.product_type, item.product_id)]
+            else:
+                item.quantity = operation.quantity
+
+
+def hold_items(user_id):
+    """A user's seat holds with their safaris and prices, listed alongside the cart"""
+    holds = active_holds(user_id)
+    if not holds:
+        return []
+    safaris = {safari.id: safari for safari in
+               Safari.query.filter(Safari.id.in_({hold.safari_id for hold in holds})).all()}
+    return [{
+        'hold': hold,
+        'product': safaris[hold.safari_id],
+        'total': float(safaris[hold.safari_id].price) * hold.seats
+    } for hold in holds if hold.safari_id in safaris]
+
+
+def cart_contents(user_id):
+    """(items, holds, subtotal) for the cart page, checkout and /cart/batch.
+
+    Items are dicts of cart_item, product and total; items whose product
+    has been deleted are left out.
+    """
+    cart_items = CartItem.query.filter_by(user_id=user_id).order_by(CartItem.id).all()
+    products = load_products(cart_items)
+    items = []
+    for item in cart_items:
+        product = product_for(products, item)
+        if product:
+            items.append({
+                'cart_item': item,
+                'product': product,
+                'total': float(product.price) * item.quantity
+            })
+
+    holds = hold_items(user_id)
+    total = sum(item['total'] for item in items + holds)
+    return items, holds, total
@@ -0,0 +1,271 @@
+# catalog.py - Bulk import and export of the wildlife and safari catalog
+import os
+import csv
+import json
+import logging
+import itertools
+from collections import namedtuple
+
+from sqlalchemy import select, insert, update
+
+from models import db, Wildlife, Safari
+from stats import reconcile_counters
+
+logger = logging.getLogger(__name__)
+
+# Columns read and written for each catalog; rows are matched on the key
+# column, so importing the same file twice updates instead of duplicating
+CATALOGS = {
+    'wildlife': {
+        'model': Wildlife,
+        'key': 'title',
+        'fields': ('title', 'description', 'image_url', 'category', 'price', 'location', 'status'),
+        'required': ('title', 'description', 'price'),
+        'defaults': {'image_url': 'default-wildlife.jpg', 'status': 'Available'},
+    },
+    'safari': {
+        'model': Safari,
+        'key': 'name',
+        'fields': ('name', 'description', 'price', 'duration', 'safari_count', 'tier', 'image_url'),
+        'required': ('name', 'price'),
+        'defaults': {'image_url': 'default-safari.jpg'},
+    },
+}
+
+FORMATS = ('csv', 'jsonl')
+
+ImportResult = namedtuple('ImportResult', 'inserted updated rejected resumed_from errors')
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path, format=None):
+    if format:
+        return format
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return 'jsonl' if extension in ('jsonl', 'ndjson', 'json') else 'csv'
+
+
+def read_rows(file, format):
+    """Yield one dict per record without reading the whole file.
+
+    A JSON line that doesn't parse is yielded as a RowError, so it is
+    reported with the other invalid records.
+    """
+    if format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield RowError(f'not valid JSON: {e}')
+            continue
+        yield record if isinstance(record, dict) else RowError('not a JSON object')
+
+
+def clean_row(catalog, raw):
+    """Validate one input record and turn it into column values"""
+    spec = CATALOGS[catalog]
+    model = spec['model']
+    row = {}
+    for field in spec['fields']:
+        value = raw.get(field)
+        if isinstance(value, str):
+            value = value.strip() or None
+        if value is None:
+            value = spec['defaults'].get(field)
+        row[field] = value
+
+    for field in spec['required']:
+        if row[field] is None:
+            raise RowError(f'{field} is required')
+
+    try:
+        row['price'] = float(row['price'])
+    except (TypeError, ValueError):
+        raise RowError(f"price {row['price']!r} is not a number")
+    if row['price'] < 0:
+        raise RowError('price cannot be negative')
+
+    if 'safari_count' in row and row['safari_count'] is not None:
+        try:
+            row['safari_count'] = int(row['safari_count'])
+        except (TypeError, ValueError):
+            raise RowError(f"safari_count {row['safari_count']!r} is not a whole number")
+
+    if raw.get('id') not in (None, ''):
+        try:
+            row['id'] = int(raw['id'])
+        except (TypeError, ValueError):
+            raise RowError(f"id {raw['id']!r} is not a whole number")
+
+    for field, value in row.items():
+        if field == 'id':
+            continue
+        length = getattr(model.__table__.c[field].type, 'length', None)
+        if length and isinstance(value, str) and len(value) > length:
+            raise RowError(f'{field} is longer than {length} characters')
+    return row
+
+
+def _upsert_batch(catalog, records):
+    """Insert new rows and update existing ones; records are (number, row) pairs.
+
+    A row is matched on its id when that names an existing row (as in a
+    file from export_catalog), otherwise on the key column. A key that more
+    than one existing row shares can't say which to update, so the record
+    is rejected. Returns (inserted, updated, [(number, error)]).
+    """
+    spec = CATALOGS[catalog]
+    model = spec['model']
+    key = spec['key']
+    key_column = getattr(model, key)
+
+    ids = {row['id'] for _, row in records if row.get('id') is not None}
+    existing_ids = set(db.session.execute(select(model.id).where(model.id.in_(ids))).scalars()) if ids else set()
+
+    # Last one wins when an id or key repeats within the batch
+    by_id, by_key = {}, {}
+    for number, row in records:
+        if row.get('id') in existing_ids:
+            by_id[row['id']] = row
+        else:
+            by_key[row[key]] = (number, {name: value for name, value in row.items() if name != 'id'})
+
+    matches = {}
+    if by_key:
+        for value, id in db.session.execute(select(key_column, model.id).where(key_column.in_(list(by_key)))):
+            matches.setdefault(value, []).append(id)
+
+    inserts, updates, errors = [], list(by_id.values()), []
+    for value, (number, row) in by_key.items():
+        found = matches.get(value, [])
+        if len(found) > 1:
+            errors.append((number, f'{len(found)} rows have {key} {value!r}; give the id of the one to update'))
+        elif found:
+            updates.append(dict(row, id=found[0]))
+        else:
+            inserts.append(row)
+
+    # ORM bulk statements, so the catalog cache sees them
+    if inserts:
+        db.session.execute(insert(model), inserts)
+    if updates:
+        db.session.execute(update(model), updates)
+    return len(inserts), len(updates), errors
+
+
+def checkpoint_path(path):
+    return path + '.progress'
+
+
+def _read_checkpoint(path):
+    try:
+        with open(checkpoint_path(path)) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_checkpoint(path, records):
+    # Write then rename, so a crash never leaves a half-written checkpoint
+    tmp = checkpoint_path(path) + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(str(records))
+    os.replace(tmp, checkpoint_path(path))
+
+
+def import_catalog(catalog, path, format=None, batch_size=1000, resume=False, max_errors=100, progress=None):
+    """Stream a CSV or JSON lines file into the catalog, one transaction per batch.
+
+    After each committed batch the number of records consumed is saved in
+    <path>.progress; with resume=True those records are skipped, so a failed
+    import can carry on where it stopped. Invalid records are skipped and
+    reported, up to max_errors before giving up.
+
+    The bulk writes skip per-row ORM events, so dashboard counters are
+    recounted at the end, also when the import fails part way. Other
+    processes see the changes once their catalog cache entries expire.
+    """
+    format = detect_format(path, format)
+    start = _read_checkpoint(path) if resume else 0
+    inserted = updated = 0
+    errors = []
+
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            records = enumerate(read_rows(f, format), start=1)
+            for _ in itertools.islice(records, start):
+                pass
+
+            while True:
+                batch = list(itertools.islice(records, batch_size))
+                if not batch:
+                    break
+
+                rows = []
+                for number, raw in batch:
+                    try:
+                        if isinstance(raw, RowError):
+                            raise raw
+                        rows.append((number, clean_row(catalog, raw)))
+                    except RowError as e:
+                        errors.append((number, str(e)))
+
+                if rows:
+                    added, changed, rejected = _upsert_batch(catalog, rows)
+                    inserted += added
+                    updated += changed
+                    errors.extend(rejected)
+                if len(errors) > max_errors:
+                    db.session.rollback()
+                    raise RowError(f'Too many invalid records ({len(errors)}); first: record {errors[0][0]}: {errors[0][1]}')
+                db.session.commit()
+
+                consumed = batch[-1][0]
+                _write_checkpoint(path, consumed)
+                if progress:
+                    progress(consumed, inserted, updated)
+
+        if os.path.exists(checkpoint_path(path)):
+            os.remove(checkpoint_path(path))
+    except BaseException:
+        # Batches committed before the failure count too, but a failing
+        # recount must not hide why the import failed
+        db.session.rollback()
+        try:
+            reconcile_counters()
+        except Exception:
+            db.session.rollback()
+            logger.exception('Recounting after a failed import failed; run flask reconcile-stats')
+        raise
+    reconcile_counters()
+    return ImportResult(inserted, updated, len(errors), start, errors)
+
+
+def export_catalog(catalog, file, format='csv', batch_size=1000):
+    """Write every row of the catalog to an open text file, streaming by id"""
+    spec = CATALOGS[catalog]
+    model = spec['model']
+    columns = ('id',) + spec['fields']
+    query = select(*(getattr(model, column) for column in columns)).order_by(model.id) \
+        .execution_options(yield_per=batch_size)
+
+    writer = csv.writer(file)
+    if format == 'csv':
+        writer.writerow(columns)
+
+    count = 0
+    for row in db.session.execute(query):
+        if format == 'csv':
+            writer.writerow(row)
+        else:
+            file.write(json.dumps(dict(zip(columns, row))) + '\n')
+        count += 1
+    return count
@@ -4,17 +4,165 @@ from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from .env file
 
+DEFAULT_SECRET_KEY = 'dev-secret-key-change-in-production'
+
+
 class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    SECRET_KEY = os.environ.get('SECRET_KEY') or DEFAULT_SECRET_KEY
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///wildlife.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
-    
 
-   
-    
+    # Connection pool for server databases (PostgreSQL, MySQL)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = True
+
+    # Applied to every new SQLite connection. WAL lets readers run alongside
+    # a writer, and busy_timeout makes writers wait instead of failing with
+    # "database is locked".
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative means KiB, so 64MB
+        'temp_store': 'MEMORY',
+    }
+
+    # In-process caches
+    CATALOG_CACHE_SIZE = int(os.environ.get('CATALOG_CACHE_SIZE', 512))
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    # Rendered {% cache %} fragments; FRAGMENT_CACHE_STORE may name a shared store
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 2048))
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 3600))
+    FRAGMENT_CACHE_STORE = os.environ.get('FRAGMENT_CACHE_STORE')
+    # Whole pages for anonymous visitors (see pagecache.py); a TTL of 0 turns it off
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    PAGE_CACHE_SIZE = 1000
+    DERIVATIVES_CHECK_TTL = 60  # seconds an upload is trusted to have (or lack) resized copies
+    PAGE_CACHE_SHARED_MAX_AGE = 60  # s-maxage for reverse proxies and CDNs
+    COMPRESS_MIN_SIZE = 1024  # bytes; smaller responses are sent as they are
+    SIMILAR_ITEMS = 3
+    # How often each process looks for catalog changes made by other processes
+    SIMILAR_ITEMS_CHECK_SECONDS = 30
+    # Compiled templates shared by every process (under the instance folder); None turns it off
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'jinja-bytecode')
+
+    # Background jobs (see jobs.py); JOB_CONCURRENCY caps running jobs per type
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 2))
+    JOB_POLL_INTERVAL = 1.0
+    JOB_TIMEOUT = 600  # seconds before a running job is presumed dead and requeued
+    JOB_RETRY_DELAY = 10  # seconds, doubled after every failed attempt
+    JOB_MAX_RETRY_DELAY = 3600
+    JOB_CONCURRENCY = {}
+
+    # Hashed, precompressed static files written by `flask build-assets`
+    ASSET_OUTPUT_DIR = 'dist'
+    ASSET_MANIFEST = 'dist/manifest.json'  # relative to the static folder; None serves the sources
+
+    # /cart/batch limits
+    CART_BATCH_LIMIT = 50  # operations per request
+    CART_MAX_QUANTITY = 99
+
+    # Safari seat inventory (see inventory.py)
+    SAFARI_DEFAULT_CAPACITY = int(os.environ.get('SAFARI_DEFAULT_CAPACITY', 20))  # seats per day until set
+    SAFARI_BOOKING_DAYS = 365  # how far ahead dates can be booked
+    SAFARI_MAX_SEATS = 10  # per hold
+    SEAT_HOLD_MINUTES = int(os.environ.get('SEAT_HOLD_MINUTES', 15))
+    SEAT_HOLD_SWEEP_SECONDS = 60
+    AVAILABILITY_TTL = int(os.environ.get('AVAILABILITY_TTL', 30))  # seconds other processes may show stale seat counts
+
+    # Payments: 'stub' approves every card charge locally, 'stripe' needs both keys
+    # (the publishable one lets Stripe.js collect the card at checkout);
+    # production refuses to start without Stripe. Other payment methods are
+    # settled outside the site and their orders stay pending.
+    PAYMENT_PROVIDER = os.environ.get('PAYMENT_PROVIDER', 'stub')
+    STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
+    STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
+    PAYMENT_CURRENCY = 'inr'
+
+    # `flask serve` (see server.py); SERVER_WORKERS defaults to 2 x CPUs + 1
+    SERVER_BIND = os.environ.get('SERVER_BIND', '127.0.0.1:8000')
+    SERVER_WORKERS = int(os.environ['SERVER_WORKERS']) if os.environ.get('SERVER_WORKERS') else None
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 1))
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 1000))  # then the worker is replaced
+    SERVER_MAX_REQUESTS_JITTER = 100  # so workers don't all restart at once
+    SERVER_TIMEOUT = 30
+    SERVER_GRACEFUL_TIMEOUT = 30
+
+    # Request instrumentation: Server-Timing headers (True, 'admin' or False)
+    # and a log of slow queries
+    SERVER_TIMING = True
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')  # file path; default is the app log
+
+    # Password hashing: pbkdf2:sha256 (cost = iterations), scrypt (cost = N)
+    # or bcrypt (cost = log rounds). Stored hashes using anything else are
+    # upgraded on the user's next login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+    PASSWORD_HASH_COST = int(os.environ.get('PASSWORD_HASH_COST', 600000))
+    # Hashes run in a bounded pool; beyond WORKERS + QUEUE in flight, logins get a 503
+    PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 8))
+    PASSWORD_HASH_TIMEOUT = 30
+
     # Admin credentials
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
-    ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@wildlife.com')
\ No newline at end of file
+    ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@wildlife.com')
+
+
+class DevelopmentConfig(Config):
+    TEMPLATES_AUTO_RELOAD = True
+    ASSET_MANIFEST = None  # edits to static files show up without a rebuild
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+    WTF_CSRF_ENABLED = False
+    CATALOG_CACHE_TTL = 0
+    USER_CACHE_TTL = 0
+    FRAGMENT_CACHE_TTL = 0
+    AVAILABILITY_TTL = 0
+    PAGE_CACHE_TTL = 0
+    DERIVATIVES_CHECK_TTL = 0
+    TEMPLATE_BYTECODE_CACHE = None
+    JOB_RETRY_DELAY = 0  # so tests can rerun failed jobs straight away
+    PASSWORD_HASH_COST = 1000  # fast hashes for the test suite
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    SERVER_TIMING = 'admin'  # DB time and query counts aren't for the public
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    PAYMENT_PROVIDER = os.environ.get('PAYMENT_PROVIDER', 'stripe')
+
+
+config = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+    'default': DevelopmentConfig,
+}
+
+
+def engine_options(app_config):
+    """SQLAlchemy engine options for the configured database"""
+    if app_config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # Flask-SQLAlchemy picks the pool for SQLite; just don't give up on a
+        # locked database before busy_timeout does
+        return {'connect_args': {'timeout': app_config['SQLITE_PRAGMAS']['busy_timeout'] / 1000}}
+
+    return {
+        'pool_size': app_config['DB_POOL_SIZE'],
+        'max_overflow': app_config['DB_MAX_OVERFLOW'],
+        'pool_recycle': app_config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': app_config['DB_POOL_PRE_PING'],
+    }
@@ -0,0 +1,124 @@
+# fragments.py - {% cache %} tag for caching rendered template fragments
+import time
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from werkzeug.utils import import_string
+
+
+class MemoryFragmentStore:
+    """Bounded LRU of rendered fragments, local to the process"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, html)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache key[, ttl] %}...{% endcache %}
+
+    The key is any expression, usually a tuple that changes whenever the
+    output would, e.g. ('card', animal.id, animal.updated_at,
+    current_user.is_authenticated). Nothing invalidates fragments; a changed
+    row gets a new key and the old entry ages out. The template name is
+    part of every key, so two templates can use the same one.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        args.append(parser.parse_expression() if parser.stream.skip_if('comma') else nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, template, key, ttl, caller):
+        return self.environment.fragment_cache.render(template, key, ttl, caller)
+
+
+class FragmentCache:
+    """Fragment store plus settings, set up from the app config.
+
+    FRAGMENT_CACHE_STORE may name (or be) any object with get(key) and
+    set(key, html, ttl), such as a client for a cache shared between
+    processes; by default fragments are kept in a MemoryFragmentStore of
+    FRAGMENT_CACHE_SIZE entries. A FRAGMENT_CACHE_TTL of 0 turns caching off.
+    """
+
+    def __init__(self):
+        self.store = MemoryFragmentStore()
+        self.ttl = 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        store = app.config.get('FRAGMENT_CACHE_STORE')
+        if isinstance(store, str):
+            store = import_string(store)()
+        self.store = store or MemoryFragmentStore(app.config.get('FRAGMENT_CACHE_SIZE', 2048))
+        self.ttl = app.config.get('FRAGMENT_CACHE_TTL', self.ttl)
+
+    def render(self, template, key, ttl, caller):
+        ttl = self.ttl if ttl is None else ttl
+        if not ttl:
+            return caller()
+
+        parts = key if isinstance(key, (tuple, list)) else (key,)
+        cache_key = 'fragment:' + '/'.join(map(str, (template,) + tuple(parts)))
+        html = self.store.get(cache_key)
+        with self._lock:
+            if html is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if html is not None:
+            return Markup(html)
+
+        html = caller()
+        self.store.set(cache_key, str(html), ttl)
+        return html
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.store) if hasattr(self.store, '__len__') else None,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
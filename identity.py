@@ -0,0 +1,160 @@
+# identity.py - Cached user loading and the denormalised cart quantity
+import time
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models import db, User, CartItem
+
+
+class UserCache:
+    """Per-process cache of logged-in users, keyed by id.
+
+    Users are detached from the session, so only their columns can be used
+    (current_user.cart_items is not available; use cart_quantity). A commit
+    that changes a user or their cart evicts that user in this process; the
+    TTL bounds how long other worker processes can serve a stale copy.
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._users = OrderedDict()  # id -> (expires_at, user)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._users.move_to_end(user_id)
+                return entry[1]
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        db.session.expunge(user)
+
+        with self._lock:
+            self._users[user_id] = (now + self.ttl, user)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+        return user
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+
+user_cache = UserCache()
+
+
+def _changed_users(session):
+    return session.info.setdefault('changed_users', set())
+
+
+def _adjust_cart_quantity(connection, target, delta):
+    # Runs inside the flush, so the counter commits or rolls back with the cart row
+    if delta:
+        table = User.__table__
+        connection.execute(
+            table.update()
+            .where(table.c.id == target.user_id)
+            .values(cart_quantity=table.c.cart_quantity + delta)
+        )
+        _changed_users(object_session(target)).add(target.user_id)
+
+
+@event.listens_for(CartItem, 'after_insert')
+def _cart_item_added(mapper, connection, target):
+    _adjust_cart_quantity(connection, target, target.quantity or 0)
+
+
+@event.listens_for(CartItem, 'after_update')
+def _cart_item_changed(mapper, connection, target):
+    history = inspect(target).attrs.quantity.history
+    if history.has_changes():
+        old = history.deleted[0] if history.deleted else 0
+        new = history.added[0] if history.added else 0
+        _adjust_cart_quantity(connection, target, (new or 0) - (old or 0))
+
+
+@event.listens_for(CartItem, 'after_delete')
+def _cart_item_removed(mapper, connection, target):
+    _adjust_cart_quantity(connection, target, -(target.quantity or 0))
+
+
+def adjust_cart_quantity(user_id, delta):
+    """Change a user's cart counter for cart writes that bypass the ORM"""
+    User.query.filter_by(id=user_id).update({User.cart_quantity: User.cart_quantity + delta})
+    _changed_users(db.session()).add(user_id)
+
+
+def add_cart_item(user_id, product_type, product_id, quantity=1):
+    """Add some of a product to a cart in a single atomic statement.
+
+    Uses INSERT ... ON CONFLICT DO UPDATE against the unique cart key where the
+    database supports it, so concurrent adds can't create duplicate rows.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        cart_item = CartItem.query.filter_by(
+            user_id=user_id, product_id=product_id, product_type=product_type
+        ).first()
+        if cart_item:
+            cart_item.quantity += quantity
+        else:
+            db.session.add(CartItem(user_id=user_id, product_id=product_id, product_type=product_type, quantity=quantity))
+        return
+
+    table = CartItem.__table__
+    statement = insert(table).values(
+        user_id=user_id, product_id=product_id, product_type=product_type, quantity=quantity
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.product_id, table.c.product_type],
+        set_={'quantity': table.c.quantity + quantity}
+    ))
+    adjust_cart_quantity(user_id, quantity)
+
+
+def clear_cart(user_id):
+    """Delete every cart row of a user in one statement and zero the counter"""
+    CartItem.query.filter_by(user_id=user_id).delete()
+    User.query.filter_by(id=user_id).update({User.cart_quantity: 0})
+    _changed_users(db.session()).add(user_id)
+
+
+def cart_quantity(user_id):
+    return db.session.query(User.cart_quantity).filter_by(id=user_id).scalar() or 0
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_users(session, flush_context):
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            _changed_users(session).add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_users(session):
+    user_ids = session.info.pop('changed_users', None)
+    if user_ids:
+        user_cache.invalidate(*user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_users(session):
+    session.info.pop('changed_users', None)
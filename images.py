@@ -0,0 +1,186 @@
+# images.py - Resized derivatives of uploaded images
+import os
+import json
+import time
+import logging
+
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+
+logger = logging.getLogger(__name__)
+
+# Target widths in pixels; images are never upscaled
+DERIVATIVE_SIZES = {
+    'thumb': 320,
+    'card': 640,
+    'hero': 1600,
+}
+
+DERIVATIVE_FORMATS = {
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+}
+
+DERIVED_DIR = 'derived'
+
+DEFAULT_SIZES = {
+    'thumb': '120px',
+    'card': '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 100vw',
+    'hero': '(min-width: 992px) 50vw, 100vw',
+}
+
+# filename -> (expires_at, {size: width} or None); negative results are
+# remembered too, so pages don't stat the upload folder on every render
+_lookups = {}
+
+
+def derived_folder():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], DERIVED_DIR)
+
+
+def derivative_name(filename, size, fmt):
+    return f"{filename}.{size}.{'jpg' if fmt == 'jpeg' else fmt}"
+
+
+def widths_name(filename):
+    return f'{filename}.json'
+
+
+def generate_derivatives(upload_folder, filename, force=False):
+    """Write every size/format derivative of an uploaded image.
+
+    A source narrower than a size's width is stored at its own width, and
+    the width each size really has is saved in <filename>.json, written
+    last. Returns the number of files written, or None if the file isn't
+    an image.
+    """
+    # Pillow is only needed by the job worker and the CLI, not to serve pages
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    source = os.path.join(upload_folder, filename)
+    target_dir = os.path.join(upload_folder, DERIVED_DIR)
+    os.makedirs(target_dir, exist_ok=True)
+
+    try:
+        with Image.open(source) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'L'):
+                original = original.convert('RGBA')
+                background = Image.new('RGB', original.size, (255, 255, 255))
+                background.paste(original, mask=original.split()[-1])
+                original = background
+            elif original.mode == 'L':
+                original = original.convert('RGB')
+
+            written = 0
+            widths = {}
+            for size, width in DERIVATIVE_SIZES.items():
+                resized = None
+                for fmt, options in DERIVATIVE_FORMATS.items():
+                    target = os.path.join(target_dir, derivative_name(filename, size, fmt))
+                    if not force and os.path.exists(target):
+                        if size not in widths:
+                            with Image.open(target) as existing:
+                                widths[size] = existing.width
+                        continue
+                    if resized is None:
+                        resized = original.copy()
+                        resized.thumbnail((width, width * 4), Image.LANCZOS)
+                        widths[size] = resized.width
+                    # Write to a temp name first so readers never see half a file
+                    partial = target + '.part'
+                    resized.save(partial, **options)
+                    os.replace(partial, target)
+                    written += 1
+
+            target = os.path.join(target_dir, widths_name(filename))
+            with open(target + '.part', 'w') as f:
+                json.dump(widths, f)
+            os.replace(target + '.part', target)
+            _lookups.pop(filename, None)
+            return written
+    except (UnidentifiedImageError, OSError) as e:
+        logger.warning('Could not create derivatives for %s: %s', filename, e)
+        return None
+
+
+def remove_derivatives(filename):
+    _lookups.pop(filename, None)
+    names = [widths_name(filename)] + [
+        derivative_name(filename, size, fmt) for size in DERIVATIVE_SIZES for fmt in DERIVATIVE_FORMATS
+    ]
+    for name in names:
+        path = os.path.join(derived_folder(), name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def derivative_widths(filename):
+    """{size: width} of the derivatives written for an upload, or None while there are none.
+
+    Looked up at most once every DERIVATIVES_CHECK_TTL seconds per file.
+    """
+    if not filename:
+        return None
+    entry = _lookups.get(filename)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    # The widths file is written last, so its presence means the set is complete
+    try:
+        with open(os.path.join(derived_folder(), widths_name(filename))) as f:
+            widths = json.load(f)
+    except (OSError, ValueError):
+        widths = None
+    _lookups[filename] = (time.monotonic() + current_app.config['DERIVATIVES_CHECK_TTL'], widths)
+    return widths
+
+
+def has_derivatives(filename):
+    """Whether responsive_image can use the resized copies; part of cached card keys"""
+    return derivative_widths(filename) is not None
+
+
+def image_srcset(filename, fmt='jpeg'):
+    """Each distinct width once; sizes wider than the source repeat the largest copy"""
+    candidates = {}
+    for size, width in derivative_widths(filename).items():
+        candidates.setdefault(width, size)
+    return ', '.join(
+        f"{url_for('static', filename=f'uploads/{DERIVED_DIR}/' + derivative_name(filename, size, fmt))} {width}w"
+        for width, size in sorted(candidates.items())
+    )
+
+
+def responsive_image(filename, alt='', variant='card', sizes=None, default='images/default-wildlife.jpg', **attrs):
+    """Render a <picture> with WebP and JPEG srcsets for an uploaded image.
+
+    Falls back to a plain <img> of the original while derivatives don't exist yet.
+    Extra keyword arguments become attributes of the <img>; use class_ for class.
+    """
+    img_attrs = {'alt': alt, 'loading': 'lazy' if variant != 'hero' else None}
+    img_attrs.update({key.rstrip('_'): value for key, value in attrs.items()})
+
+    if not filename:
+        img_attrs['src'] = url_for('static', filename=default)
+        return Markup('<img %s>') % _attributes(img_attrs)
+
+    if not has_derivatives(filename):
+        img_attrs['src'] = url_for('static', filename='uploads/' + filename)
+        return Markup('<img %s>') % _attributes(img_attrs)
+
+    sizes = sizes or DEFAULT_SIZES[variant]
+    img_attrs.update({
+        'src': url_for('static', filename=f'uploads/{DERIVED_DIR}/' + derivative_name(filename, variant, 'jpeg')),
+        'srcset': image_srcset(filename, 'jpeg'),
+        'sizes': sizes,
+    })
+    source_attrs = {'type': 'image/webp', 'srcset': image_srcset(filename, 'webp'), 'sizes': sizes}
+    return Markup('<picture><source %s><img %s></picture>') % (
+        _attributes(source_attrs), _attributes(img_attrs)
+    )
+
+
+def _attributes(attrs):
+    return Markup(' '.join(
+        f'{escape(key)}="{escape(value)}"' for key, value in attrs.items() if value is not None
+    ))
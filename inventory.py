@@ -0,0 +1,276 @@
+# inventory.py - Seats per safari per date, cart holds and the availability calendar
+import time
+import calendar
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import db, SafariDate, SeatHold
+
+
+class InventoryError(Exception):
+    """A booking that can't be made; the message is shown to the user"""
+
+
+class SoldOut(InventoryError):
+    pass
+
+
+class HoldExpired(InventoryError):
+    pass
+
+
+def _changed_safaris(session):
+    return session.info.setdefault('inventory_changed', set())
+
+
+def check_booking(day, seats):
+    """Raise InventoryError unless `seats` on `day` is a booking we take"""
+    today = date.today()
+    if day < today:
+        raise InventoryError('That date has already passed')
+    if day >= today + timedelta(days=current_app.config['SAFARI_BOOKING_DAYS']):
+        raise InventoryError('That date is not open for booking yet')
+    if not 1 <= seats <= current_app.config['SAFARI_MAX_SEATS']:
+        raise InventoryError(f"Book between 1 and {current_app.config['SAFARI_MAX_SEATS']} seats at a time")
+
+
+def _add_date(safari_id, day):
+    """Create the SafariDate row with the default capacity; True if this call created it"""
+    values = {'safari_id': safari_id, 'date': day,
+              'capacity': current_app.config['SAFARI_DEFAULT_CAPACITY'], 'booked': 0}
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.add(SafariDate(**values))
+            return True
+        except IntegrityError:
+            return False
+    return bool(db.session.execute(insert(SafariDate).values(**values).on_conflict_do_nothing()).rowcount)
+
+
+def reserve_seats(safari_id, day, seats):
+    """Take seats on a date if that many are left; True if they were taken.
+
+    A single UPDATE ... WHERE booked + seats <= capacity, so concurrent
+    bookings never read a count and write it back: the database serialises
+    them on the row and the ones that no longer fit match nothing. Rows are
+    created on first use.
+    """
+    def take():
+        return db.session.execute(
+            update(SafariDate)
+            .where(SafariDate.safari_id == safari_id, SafariDate.date == day,
+                   SafariDate.booked + seats <= SafariDate.capacity)
+            .values(booked=SafariDate.booked + seats)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    # Only a date nobody has booked yet is worth a second try
+    taken = take() or (_add_date(safari_id, day) and take())
+    if taken:
+        _changed_safaris(db.session()).add(safari_id)
+    return bool(taken)
+
+
+def release_seats(safari_id, day, seats):
+    db.session.execute(
+        update(SafariDate)
+        .where(SafariDate.safari_id == safari_id, SafariDate.date == day, SafariDate.booked >= seats)
+        .values(booked=SafariDate.booked - seats)
+        .execution_options(synchronize_session=False)
+    )
+    _changed_safaris(db.session()).add(safari_id)
+
+
+def hold_seats(user_id, safari_id, day, seats):
+    """Reserve seats for a user's cart until SEAT_HOLD_MINUTES from now.
+
+    Adds the SeatHold to the session; commit straight away so the seat row
+    isn't kept locked. Raises InventoryError or SoldOut.
+    """
+    check_booking(day, seats)
+    if not reserve_seats(safari_id, day, seats):
+        # Holds that ran out may still be counted against the date
+        if not sweep_expired_holds(safari_id, day) or not reserve_seats(safari_id, day, seats):
+            raise SoldOut('Not enough seats left on that date')
+
+    hold = SeatHold(
+        user_id=user_id, safari_id=safari_id, date=day, seats=seats,
+        expires_at=datetime.now() + timedelta(minutes=current_app.config['SEAT_HOLD_MINUTES'])
+    )
+    db.session.add(hold)
+    return hold
+
+
+def _release_hold(hold, expired_before=None):
+    # Deleting the hold is what claims it, so a hold is released at most once
+    # even when checkout, the user and the sweeper race for it
+    query = delete(SeatHold).where(SeatHold.id == hold.id)
+    if expired_before is not None:
+        query = query.where(SeatHold.expires_at <= expired_before)
+    if not db.session.execute(query.execution_options(synchronize_session=False)).rowcount:
+        return False
+    release_seats(hold.safari_id, hold.date, hold.seats)
+    return True
+
+
+def release_hold(hold_id, user_id):
+    """Give back the seats of one of a user's holds; False if it wasn't theirs or is gone"""
+    hold = db.session.get(SeatHold, hold_id)
+    if hold is None or hold.user_id != user_id:
+        return False
+    db.session.expunge(hold)
+    return _release_hold(hold)
+
+
+def sweep_expired_holds(safari_id=None, day=None, batch_size=500):
+    """Release holds past their expiry, optionally only for one safari date; returns how many"""
+    now = datetime.now()
+    query = select(SeatHold.id, SeatHold.safari_id, SeatHold.date, SeatHold.seats) \
+        .where(SeatHold.expires_at <= now).order_by(SeatHold.expires_at).limit(batch_size)
+    if safari_id is not None:
+        query = query.where(SeatHold.safari_id == safari_id, SeatHold.date == day)
+
+    released = 0
+    while True:
+        holds = db.session.execute(query).all()
+        released += sum(_release_hold(hold, expired_before=now) for hold in holds)
+        if len(holds) < batch_size:
+            return released
+
+
+def active_holds(user_id):
+    """A user's unexpired holds, soonest travel date first"""
+    return SeatHold.query.filter(SeatHold.user_id == user_id, SeatHold.expires_at > datetime.now()) \
+        .order_by(SeatHold.date, SeatHold.id).all()
+
+
+def confirm_holds(holds):
+    """Turn holds into sold seats at checkout.
+
+    Each hold is claimed with a conditional DELETE, so one the sweeper is
+    releasing at the same moment can't be sold as well. The seats stay
+    booked. Raises HoldExpired if a hold ran out first; roll back then.
+    """
+    now = datetime.now()
+    for hold in holds:
+        claimed = db.session.execute(
+            delete(SeatHold).where(SeatHold.id == hold.id, SeatHold.expires_at > now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not claimed:
+            raise HoldExpired(f'Your hold on {hold.date:%d %b %Y} expired; please choose the date again')
+        db.session.expunge(hold)
+
+
+def set_capacity(safari_id, start, days, capacity):
+    """Set the seats on a run of dates; dates already booked past `capacity` are left alone.
+
+    Returns the dates that were skipped.
+    """
+    skipped = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        _add_date(safari_id, day)
+        changed = db.session.execute(
+            update(SafariDate)
+            .where(SafariDate.safari_id == safari_id, SafariDate.date == day, SafariDate.booked <= capacity)
+            .values(capacity=capacity)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not changed:
+            skipped.append(day)
+    _changed_safaris(db.session()).add(safari_id)
+    return skipped
+
+
+class AvailabilityCalendar:
+    """Seats left on every bookable day, one compact array per safari.
+
+    A safari's array ('I', four bytes a day, starting today) is built from
+    its SafariDate rows in one query, with the default capacity for days
+    that have none, and a month is a slice of it. A commit that changes a
+    safari's seats drops its array in this process; AVAILABILITY_TTL bounds
+    how stale other processes can be. Only for display: holds always check
+    the database.
+    """
+
+    def __init__(self, ttl=30, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._arrays = OrderedDict()  # safari_id -> (expires_at, first_day, seats_left)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('AVAILABILITY_TTL', self.ttl)
+        app.extensions['availability'] = self
+
+    def seats_left(self, safari_id):
+        """(first day, array of seats left from that day on) for a safari"""
+        now = time.monotonic()
+        today = date.today()
+        with self._lock:
+            entry = self._arrays.get(safari_id)
+            if entry is not None and entry[0] > now and entry[1] == today:
+                self._arrays.move_to_end(safari_id)
+                return entry[1], entry[2]
+
+        days = current_app.config['SAFARI_BOOKING_DAYS']
+        # Not 'H': set-capacity accepts more than 65535 seats
+        seats = array('I', [current_app.config['SAFARI_DEFAULT_CAPACITY']]) * days
+        rows = db.session.execute(
+            select(SafariDate.date, SafariDate.capacity - SafariDate.booked)
+            .where(SafariDate.safari_id == safari_id, SafariDate.date >= today,
+                   SafariDate.date < today + timedelta(days=days))
+        )
+        for day, left in rows:
+            seats[(day - today).days] = max(left, 0)
+
+        with self._lock:
+            self._arrays[safari_id] = (now + self.ttl, today, seats)
+            self._arrays.move_to_end(safari_id)
+            while len(self._arrays) > self.max_entries:
+                self._arrays.popitem(last=False)
+        return today, seats
+
+    def month(self, safari_id, year, month):
+        """[(date, seats left or None when not bookable)] for every day of a month"""
+        first_day, seats = self.seats_left(safari_id)
+        result = []
+        for day in range(1, calendar.monthrange(year, month)[1] + 1):
+            current = date(year, month, day)
+            index = (current - first_day).days
+            result.append((current, seats[index] if 0 <= index < len(seats) else None))
+        return result
+
+    def invalidate(self, *safari_ids):
+        with self._lock:
+            for safari_id in safari_ids:
+                self._arrays.pop(safari_id, None)
+
+
+availability = AvailabilityCalendar()
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_availability(session):
+    safari_ids = session.info.pop('inventory_changed', None)
+    if safari_ids:
+        availability.invalidate(*safari_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_availability(session):
+    session.info.pop('inventory_changed', None)
@@ -0,0 +1,243 @@
+# jobs.py - Durable background job queue backed by the database
+import os
+import json
+import random
+import socket
+import logging
+import time
+import threading
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, func
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+JobType = namedtuple('JobType', 'func concurrency max_attempts')
+PeriodicTask = namedtuple('PeriodicTask', 'func interval')
+
+_job_types = {}
+_periodic_tasks = []
+
+
+def job(name, concurrency=None, max_attempts=5):
+    """Register a function as the handler for a job type.
+
+    concurrency caps how many jobs of this type run at once across all
+    workers (None for no cap). The handler gets the job's payload as keyword
+    arguments; its database changes commit together with the job's status.
+    """
+    def register(func):
+        _job_types[name] = JobType(func, concurrency, max_attempts)
+        return func
+    return register
+
+
+def periodic(interval):
+    """Register a function for every Worker to call each `interval` seconds.
+
+    interval may be a config key holding the seconds. Tasks run in the
+    worker's first thread and commit afterwards; with several workers running
+    they run in each of them, so a task must be safe to run concurrently.
+    """
+    def register(func):
+        _periodic_tasks.append(PeriodicTask(func, interval))
+        return func
+    return register
+
+
+def enqueue(job_type, payload=None, delay=0, max_attempts=None):
+    """Add a job to the current session.
+
+    Nothing is queued until the caller commits, so a job is durable exactly
+    when the change that asked for it is.
+    """
+    if job_type not in _job_types:
+        raise ValueError(f'Unknown job type: {job_type}')
+    new_job = Job(
+        type=job_type,
+        payload=json.dumps(payload or {}),
+        max_attempts=max_attempts or _job_types[job_type].max_attempts,
+        run_at=datetime.now() + timedelta(seconds=delay),
+    )
+    db.session.add(new_job)
+    return new_job
+
+
+class Worker:
+    """Claims due jobs and runs them in a few threads.
+
+    A job is claimed with a conditional UPDATE (status still 'queued', and its
+    type under its concurrency cap), so two workers can never run the same
+    job. Failed jobs are retried with exponential backoff until max_attempts;
+    jobs whose worker died are put back once JOB_TIMEOUT has passed.
+    """
+
+    def __init__(self, app, concurrency=None, types=None, poll_interval=None):
+        self.app = app
+        self.concurrency = concurrency or app.config.get('JOB_WORKER_THREADS', 2)
+        self.types = types
+        self.poll_interval = poll_interval or app.config.get('JOB_POLL_INTERVAL', 1.0)
+        self.timeout = app.config.get('JOB_TIMEOUT', 600)
+        self.retry_delay = app.config.get('JOB_RETRY_DELAY', 10)
+        self.max_retry_delay = app.config.get('JOB_MAX_RETRY_DELAY', 3600)
+        self.limits = {name: job_type.concurrency for name, job_type in _job_types.items()}
+        self.limits.update(app.config.get('JOB_CONCURRENCY', {}))
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._next_runs = {}
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Run in daemon threads alongside the caller"""
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(i,), daemon=True, name=f'job-worker-{i}')
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def run(self, burst=False):
+        """Run until stopped, or with burst=True until no job is due"""
+        threads = [
+            threading.Thread(target=self._loop, args=(i, burst), name=f'job-worker-{i}')
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_pending(self):
+        """Run every due job in the calling thread; returns how many ran"""
+        count = 0
+        with self.app.app_context():
+            while True:
+                job_id = self.claim(f'{self.name}:inline')
+                if job_id is None:
+                    return count
+                self.execute(job_id)
+                count += 1
+
+    def _loop(self, index, burst=False):
+        worker_id = f'{self.name}:{index}'
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    if index == 0:
+                        self.requeue_stale()
+                        self.run_periodic()
+                    job_id = self.claim(worker_id)
+                    if job_id is not None:
+                        self.execute(job_id)
+                        continue
+            except Exception:
+                logger.exception('Job worker %s failed', worker_id)
+            if burst:
+                return
+            self._stop.wait(self.poll_interval)
+
+    def run_periodic(self):
+        """Call the periodic tasks that are due"""
+        now = time.monotonic()
+        for task in _periodic_tasks:
+            if self._next_runs.get(task.func, 0) > now:
+                continue
+            interval = task.interval
+            if isinstance(interval, str):
+                interval = self.app.config[interval]
+            self._next_runs[task.func] = now + interval
+            try:
+                task.func()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Periodic task %s failed', task.func.__name__)
+
+    def claim(self, worker_id):
+        """Mark one due job as running by this worker and return its id"""
+        now = datetime.now()
+        query = select(Job.id, Job.type).where(Job.status == 'queued', Job.run_at <= now) \
+            .order_by(Job.run_at, Job.id).limit(20)
+        if self.types:
+            query = query.where(Job.type.in_(self.types))
+
+        for job_id, job_type in db.session.execute(query).all():
+            claim = update(Job).where(Job.id == job_id, Job.status == 'queued')
+            limit = self.limits.get(job_type)
+            if limit:
+                running = select(func.count()).select_from(Job) \
+                    .where(Job.type == job_type, Job.status == 'running').scalar_subquery()
+                claim = claim.where(running < limit)
+            claimed = db.session.execute(claim.values(
+                status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1
+            ).execution_options(synchronize_session=False)).rowcount
+            db.session.commit()
+            if claimed:
+                return job_id
+        return None
+
+    def execute(self, job_id):
+        current = db.session.get(Job, job_id)
+        job_type = _job_types.get(current.type)
+        try:
+            if job_type is None:
+                raise LookupError(f'No handler for job type {current.type}')
+            job_type.func(**json.loads(current.payload))
+        except Exception:
+            error = traceback.format_exc()
+            db.session.rollback()
+            current = db.session.get(Job, job_id)
+            current.last_error = error
+            if job_type is None or current.attempts >= current.max_attempts:
+                current.status = 'failed'
+                current.finished_at = datetime.now()
+                logger.error('Job %s (%s) failed for good: %s', job_id, current.type, error)
+            else:
+                current.status = 'queued'
+                current.run_at = datetime.now() + timedelta(seconds=self.backoff(current.attempts))
+                logger.warning('Job %s (%s) failed, will retry: %s', job_id, current.type, error)
+        else:
+            current.status = 'done'
+            current.finished_at = datetime.now()
+        current.locked_by = None
+        db.session.commit()
+
+    def backoff(self, attempts):
+        """Seconds before retry number `attempts`: doubling, capped, with jitter"""
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.max_retry_delay)
+        return delay * random.uniform(0.8, 1.2)
+
+    def requeue_stale(self):
+        """Put back jobs whose worker stopped without finishing them"""
+        cutoff = datetime.now() - timedelta(seconds=self.timeout)
+        requeued = db.session.execute(
+            update(Job).where(Job.status == 'running', Job.locked_at < cutoff)
+            .values(status='queued', locked_by=None, run_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if requeued:
+            logger.warning('Requeued %d stale jobs', requeued)
+        return requeued
+
+
+def queue_stats():
+    """Job counts by type and status"""
+    stats = {}
+    for job_type, status, count in db.session.execute(
+        select(Job.type, Job.status, func.count()).group_by(Job.type, Job.status)
+    ):
+        stats.setdefault(job_type, {})[status] = count
+    return stats
@@ -0,0 +1,164 @@
+# metrics.py - Per-request SQL and timing instrumentation
+import time
+import logging
+import threading
+
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+
+from models import db
+
+slow_query_logger = logging.getLogger('wildlife.slow_queries')
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per endpoint"""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}  # endpoint -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for endpoint, series in sorted(self._series.items()):
+                label = f'endpoint="{endpoint}"'
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-2]}')
+                lines.append(f'{self.name}_count{{{label}}} {series[-2]}')
+                lines.append(f'{self.name}_sum{{{label}}} {series[-1]:.6f}')
+        return lines
+
+
+class RequestMetrics:
+    """Query count, DB time, template time and total time for every request.
+
+    Responses get a Server-Timing header (SERVER_TIMING: True for every
+    client, 'admin' for admins only, False for none), queries slower than
+    SLOW_QUERY_MS are logged with the route that ran them, and the totals
+    are kept as per-endpoint histograms for /admin/metrics. Histograms are
+    per process; scrape each worker.
+    """
+
+    def __init__(self):
+        self.slow_query_ms = 100
+        self.server_timing = True
+        self.duration = Histogram('http_request_duration_seconds',
+                                  'Time spent handling the request.', SECONDS_BUCKETS)
+        self.db_time = Histogram('http_request_db_seconds',
+                                 'Time spent in SQL queries per request.', SECONDS_BUCKETS)
+        self.template_time = Histogram('http_request_template_seconds',
+                                       'Time spent rendering templates per request.', SECONDS_BUCKETS)
+        self.queries = Histogram('http_request_queries',
+                                 'SQL queries run per request.', QUERY_BUCKETS)
+        self._responses = {}  # (endpoint, status) -> count
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', self.slow_query_ms)
+        self.server_timing = app.config.get('SERVER_TIMING', self.server_timing)
+        app.extensions['metrics'] = self
+
+        if app.config.get('SLOW_QUERY_LOG'):
+            handler = logging.FileHandler(app.config['SLOW_QUERY_LOG'])
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.WARNING)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        app.before_request(_start_request)
+        app.after_request(self._finish_request)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if not has_request_context():
+            return  # background threads and CLI commands
+        stats = g.get('request_metrics')
+        if stats is not None:
+            stats['queries'] += 1
+            stats['db'] += elapsed
+        if elapsed * 1000 >= self.slow_query_ms:
+            slow_query_logger.warning('%.1fms %s %s: %s', elapsed * 1000, request.method,
+                                      request.endpoint or request.path, ' '.join(statement.split()))
+
+    def _finish_request(self, response):
+        stats = g.pop('request_metrics', None)
+        if stats is None:
+            return response
+        total = time.perf_counter() - stats['start']
+        endpoint = request.endpoint or 'unmatched'
+
+        self.duration.observe(endpoint, total)
+        self.db_time.observe(endpoint, stats['db'])
+        self.template_time.observe(endpoint, stats['render'])
+        self.queries.observe(endpoint, stats['queries'])
+        with self._lock:
+            key = (endpoint, response.status_code)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+        if self.server_timing is True or (self.server_timing == 'admin' and current_user.is_authenticated
+                                          and current_user.is_admin):
+            response.headers.add('Server-Timing', ', '.join([
+                f'db;dur={stats["db"] * 1000:.2f};desc="{stats["queries"]} queries"',
+                f'tpl;dur={stats["render"] * 1000:.2f}',
+                f'total;dur={total * 1000:.2f}',
+            ]))
+        return response
+
+    def expose(self):
+        """All metrics in the Prometheus text format"""
+        lines = ['# HELP http_responses_total Responses sent, by endpoint and status.',
+                 '# TYPE http_responses_total counter']
+        with self._lock:
+            for (endpoint, status), count in sorted(self._responses.items()):
+                lines.append(f'http_responses_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+        for histogram in (self.duration, self.db_time, self.template_time, self.queries):
+            lines.extend(histogram.expose())
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def _start_request():
+    g.request_metrics = {'start': time.perf_counter(), 'queries': 0, 'db': 0.0, 'render': 0.0}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _before_render(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    stats = g.get('request_metrics')
+    started = g.pop('template_start', None)
+    if stats is not None and started is not None:
+        stats['render'] += time.perf_counter() - started
@@ -0,0 +1,149 @@
+# migrations.py - Versioned, in-place schema upgrades for existing databases
+from datetime import datetime
+
+from sqlalchemy import inspect, select, func, text
+
+from models import db, User, CartItem, Safari
+
+# Applied migrations, one row per version
+schema_version = db.Table(
+    'schema_version',
+    db.Column('version', db.Integer, primary_key=True),
+    db.Column('description', db.String(200), nullable=False),
+    db.Column('applied_at', db.DateTime, nullable=False),
+)
+
+
+def _quote(conn, name):
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def _has_column(conn, table, column):
+    return any(c['name'] == column for c in inspect(conn).get_columns(table))
+
+
+def _has_index(conn, table, name):
+    inspector = inspect(conn)
+    return any(i['name'] == name for i in inspector.get_indexes(table)) or \
+        any(c['name'] == name for c in inspector.get_unique_constraints(table))
+
+
+def _add_column(conn, table, column, ddl):
+    if not _has_column(conn, table, column):
+        conn.execute(text(f'ALTER TABLE {_quote(conn, table)} ADD COLUMN {_quote(conn, column)} {ddl}'))
+
+
+def _create_index(conn, name, table, columns, unique=False):
+    if not _has_index(conn, table, name):
+        conn.execute(text('CREATE {}INDEX {} ON {} ({})'.format(
+            'UNIQUE ' if unique else '',
+            _quote(conn, name),
+            _quote(conn, table),
+            ', '.join(_quote(conn, column) for column in columns)
+        )))
+
+
+def add_cart_quantity(conn):
+    _add_column(conn, 'user', 'cart_quantity', 'INTEGER NOT NULL DEFAULT 0')
+    users, cart = User.__table__, CartItem.__table__
+    conn.execute(users.update().values(cart_quantity=(
+        select(func.coalesce(func.sum(cart.c.quantity), 0))
+        .where(cart.c.user_id == users.c.id)
+        .scalar_subquery()
+    )))
+
+
+def add_order_idempotency_key(conn):
+    _add_column(conn, 'order', 'idempotency_key', 'VARCHAR(64)')
+    _create_index(conn, 'uq_order_user_idempotency_key', 'order', ['user_id', 'idempotency_key'], unique=True)
+
+
+def add_lookup_indexes(conn):
+    # Fold duplicate cart rows into one before the cart key becomes unique
+    cart = CartItem.__table__
+    key = (cart.c.user_id, cart.c.product_id, cart.c.product_type)
+    duplicates = conn.execute(
+        select(*key, func.min(cart.c.id), func.sum(cart.c.quantity))
+        .group_by(*key)
+        .having(func.count() > 1)
+    ).all()
+    for user_id, product_id, product_type, keep_id, quantity in duplicates:
+        same_product = (cart.c.user_id == user_id) & (cart.c.product_id == product_id) & \
+            (cart.c.product_type == product_type)
+        conn.execute(cart.update().where(cart.c.id == keep_id).values(quantity=quantity))
+        conn.execute(cart.delete().where(same_product & (cart.c.id != keep_id)))
+
+    _create_index(conn, 'uq_cart_item_product', 'cart_item', ['user_id', 'product_id', 'product_type'], unique=True)
+    _create_index(conn, 'ix_order_user_created', 'order', ['user_id', 'created_at'])
+    _create_index(conn, 'ix_order_created_id', 'order', ['created_at', 'id'])
+    _create_index(conn, 'ix_order_item_order_id', 'order_item', ['order_id'])
+    _create_index(conn, 'ix_wildlife_category', 'wildlife', ['category'])
+    _create_index(conn, 'ix_safari_tier', 'safari', ['tier'])
+
+
+def add_catalog_updated_at(conn):
+    _add_column(conn, 'safari', 'updated_at', 'DATETIME')
+    safaris = Safari.__table__
+    conn.execute(safaris.update().where(safaris.c.updated_at.is_(None)).values(
+        updated_at=func.coalesce(safaris.c.created_at, datetime.now())
+    ))
+    _create_index(conn, 'ix_wildlife_updated_at', 'wildlife', ['updated_at'])
+    _create_index(conn, 'ix_safari_updated_at', 'safari', ['updated_at'])
+
+
+def add_order_item_travel_date(conn):
+    _add_column(conn, 'order_item', 'travel_date', 'DATE')
+
+
+def add_order_payment_token(conn):
+    _add_column(conn, 'order', 'payment_token', 'VARCHAR(255)')
+
+
+def add_catalog_key_indexes(conn):
+    _create_index(conn, 'ix_wildlife_title', 'wildlife', ['title'])
+    _create_index(conn, 'ix_safari_name', 'safari', ['name'])
+
+
+# (version, description, upgrade function); append only, never renumber
+MIGRATIONS = [
+    (1, 'Add user.cart_quantity', add_cart_quantity),
+    (2, 'Add order.idempotency_key', add_order_idempotency_key),
+    (3, 'Add unique cart key and lookup indexes', add_lookup_indexes),
+    (4, 'Add safari.updated_at and catalog updated_at indexes', add_catalog_updated_at),
+    (5, 'Add order_item.travel_date', add_order_item_travel_date),
+    (6, 'Index the catalog import keys', add_catalog_key_indexes),
+    (7, 'Add order.payment_token', add_order_payment_token),
+]
+
+
+def current_version(conn):
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def upgrade_database():
+    """Create missing tables and apply pending migrations, each in its own transaction.
+
+    A brand new database gets the current schema from create_all and every
+    migration is just recorded as applied. Returns the versions applied.
+    """
+    with db.engine.connect() as conn:
+        fresh = not inspect(conn).has_table(User.__tablename__)
+
+    # Creates new tables only; existing tables are left to the migrations
+    db.create_all()
+
+    with db.engine.connect() as conn:
+        applied = set(conn.execute(select(schema_version.c.version)).scalars())
+
+    upgraded = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with db.engine.begin() as conn:
+            if not fresh:
+                migrate(conn)
+            conn.execute(schema_version.insert().values(
+                version=version, description=description, applied_at=datetime.now()
+            ))
+        upgraded.append(version)
+    return upgraded
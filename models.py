@@ -12,6 +12,8 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
+    # Sum of CartItem.quantity, maintained by identity.py for the navbar badge
+    cart_quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     cart_items = db.relationship('CartItem', backref='user', cascade='all, delete-orphan')
@@ -20,27 +22,28 @@ class User(UserMixin, db.Model):
 
 class Wildlife(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
+    title = db.Column(db.String(100), nullable=False, index=True)  # catalog imports match on it
     description = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(300))
-    category = db.Column(db.String(50))
+    category = db.Column(db.String(50), index=True)
     price = db.Column(db.Float, nullable=False)
     location = db.Column(db.String(100))
     status = db.Column(db.String(20), default='Available')
     created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
 
 class Safari(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(150), nullable=False)
+    name = db.Column(db.String(150), nullable=False, index=True)  # catalog imports match on it
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     duration = db.Column(db.String(50))
     safari_count = db.Column(db.Integer)
-    tier = db.Column(db.String(30))
+    tier = db.Column(db.String(30), index=True)
     image_url = db.Column(db.String(300))
     created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
 
 class CartItem(db.Model):
@@ -51,6 +54,11 @@ class CartItem(db.Model):
     quantity = db.Column(db.Integer, default=1)
     added_at = db.Column(db.DateTime, default=datetime.now)
 
+    __table_args__ = (
+        # One row per product per cart; add_to_cart upserts against it
+        db.UniqueConstraint('user_id', 'product_id', 'product_type', name='uq_cart_item_product'),
+    )
+
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -58,20 +66,112 @@ class Order(db.Model):
     total_amount = db.Column(db.Float, nullable=False)
     payment_status = db.Column(db.String(20), default='pending')  # pending, completed, failed
     payment_method = db.Column(db.String(50))
+    # The card to charge for 'card' orders: a Stripe PaymentMethod id (pm_...)
+    payment_token = db.Column(db.String(255))
     shipping_address = db.Column(db.Text)
     shipping_city = db.Column(db.String(100))
     shipping_state = db.Column(db.String(100))
     shipping_pincode = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.now)
+    # Client-supplied key that makes checkout retries return the same order
+    idempotency_key = db.Column(db.String(64))
 
     # Relationships
     items = db.relationship('OrderItem', backref='order', cascade='all, delete-orphan')
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'idempotency_key', name='uq_order_user_idempotency_key'),
+        db.Index('ix_order_user_created', 'user_id', 'created_at'),
+        db.Index('ix_order_created_id', 'created_at', 'id'),
+    )
+
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     product_type = db.Column(db.String(20), nullable=False)
     product_id = db.Column(db.Integer, nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    price = db.Column(db.Float, nullable=False)
\ No newline at end of file
+    price = db.Column(db.Float, nullable=False)
+    travel_date = db.Column(db.Date)  # safari bookings made through a seat hold
+
+
+class SafariDate(db.Model):
+    """Seats on one safari on one day; inventory.py only changes booked with conditional UPDATEs"""
+    safari_id = db.Column(db.Integer, db.ForeignKey('safari.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    capacity = db.Column(db.Integer, nullable=False)
+    booked = db.Column(db.Integer, nullable=False, default=0)  # held in carts plus sold
+
+    __table_args__ = (
+        db.CheckConstraint('booked >= 0 AND booked <= capacity', name='ck_safari_date_booked'),
+    )
+
+
+class SeatHold(db.Model):
+    """Seats taken from a SafariDate for a cart until checkout or expires_at"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    safari_id = db.Column(db.Integer, db.ForeignKey('safari.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    seats = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+
+class SiteStat(db.Model):
+    """Running totals for the admin dashboard, kept up to date by stats.py"""
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    """Background work queued by a request and run by jobs.Worker"""
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Workers look for due jobs by status and run_at
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+        db.Index('ix_job_type_status', 'type', 'status'),
+    )
+
+
+PRODUCT_MODELS = {
+    'wildlife': Wildlife,
+    'safari': Safari,
+}
+
+
+def load_products(items):
+    """Fetch the products behind cart/order items, one IN query per product type.
+
+    Returns a dict keyed by (product_type, product_id).
+    """
+    ids_by_type = {}
+    for item in items:
+        product_type = item.product_type if item.product_type in PRODUCT_MODELS else 'safari'
+        ids_by_type.setdefault(product_type, set()).add(item.product_id)
+
+    products = {}
+    for product_type, ids in ids_by_type.items():
+        model = PRODUCT_MODELS[product_type]
+        for product in model.query.filter(model.id.in_(ids)).all():
+            products[(product_type, product.id)] = product
+    return products
+
+
+def product_for(products, item):
+    """Look up an item's product in a dict returned by load_products."""
+    product_type = item.product_type if item.product_type in PRODUCT_MODELS else 'safari'
+    return products.get((product_type, item.product_id))
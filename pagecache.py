@@ -0,0 +1,171 @@
+# pagecache.py - Whole-page cache for anonymous visitors, ETags and response compression
+import gzip
+import hashlib
+import threading
+from collections import namedtuple
+
+from flask import current_app, request, session, g
+from flask_login import current_user
+
+try:
+    import brotli
+except ImportError:  # responses are gzipped only
+    brotli = None
+
+from cache import on_catalog_commit
+from fragments import MemoryFragmentStore
+
+# Pages whose HTML is the same for every anonymous visitor
+CACHED_ENDPOINTS = {
+    'main.index', 'main.wildlife_gallery', 'main.wildlife_detail', 'main.safari_packages', 'main.safari_detail',
+    'main.about', 'main.contact',
+}
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml',
+}
+
+CachedPage = namedtuple('CachedPage', 'etag content_type body encoded')
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+class PageCache:
+    """Stores the HTML of public pages as served to anonymous visitors.
+
+    A GET for one of PAGE_CACHE_ENDPOINTS from a visitor who isn't logged
+    in and has no flashed messages waiting is answered from the cache,
+    keyed by host and full path. Entries carry a weak ETag, so
+    If-None-Match gets a 304, and compressed copies are kept next to the
+    body. Cache-Control lets browsers revalidate every time and shared
+    caches keep a page for PAGE_CACHE_SHARED_MAX_AGE seconds. Any catalog
+    commit empties the cache in this process; PAGE_CACHE_TTL bounds how
+    stale other processes can be.
+
+    Every other text response of COMPRESS_MIN_SIZE bytes or more is
+    compressed on the way out.
+    """
+
+    def __init__(self):
+        self.store = MemoryFragmentStore()
+        self.ttl = 300
+        self.shared_max_age = 60
+        self.min_size = 1024
+        self.endpoints = CACHED_ENDPOINTS
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.store = MemoryFragmentStore(app.config.get('PAGE_CACHE_SIZE', 1000))
+        self.ttl = app.config.get('PAGE_CACHE_TTL', self.ttl)
+        self.shared_max_age = app.config.get('PAGE_CACHE_SHARED_MAX_AGE', self.shared_max_age)
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.endpoints = set(app.config.get('PAGE_CACHE_ENDPOINTS', CACHED_ENDPOINTS))
+        app.extensions['page_cache'] = self
+
+        app.before_request(self._serve_cached)
+        app.after_request(self._finish_response)
+        on_catalog_commit(self._purge)
+
+    def _cacheable(self):
+        return bool(self.ttl) and request.method in ('GET', 'HEAD') and request.endpoint in self.endpoints \
+            and not current_user.is_authenticated and '_flashes' not in session
+
+    def _key(self):
+        return f'page:{request.host}{request.full_path}'
+
+    def _serve_cached(self):
+        if not self._cacheable():
+            return None
+        page = self.store.get(self._key())
+        with self._lock:
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if page is None:
+            g.page_cache_store = True
+            return None
+
+        g.page_cache_hit = True
+        response = current_app.response_class(page.body, content_type=page.content_type)
+        self._add_validators(response, page.etag)
+        return self._not_modified(response, page.etag) or self._encode(response, page)
+
+    def _finish_response(self, response):
+        if g.pop('page_cache_hit', False):
+            return response
+
+        if g.pop('page_cache_store', False) and response.status_code == 200 and not response.direct_passthrough \
+                and not response.is_streamed and response.mimetype == 'text/html':
+            body = response.get_data()
+            page = CachedPage('W/"%s"' % hashlib.sha1(body).hexdigest()[:20], response.content_type, body, {})
+            self.store.set(self._key(), page, self.ttl)
+            self._add_validators(response, page.etag)
+            return self._not_modified(response, page.etag) or self._encode(response, page)
+
+        if request.endpoint in self.endpoints and current_user.is_authenticated:
+            response.headers.setdefault('Cache-Control', 'private, no-cache')
+        return self._encode(response)
+
+    def _add_validators(self, response, etag):
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = f'public, max-age=0, s-maxage={self.shared_max_age}'
+        response.vary.update(('Accept-Encoding', 'Cookie'))
+
+    def _not_modified(self, response, etag):
+        if etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in
+                                       request.headers.get('If-None-Match', '').replace(' ', '').split(',')]:
+            response.status_code = 304
+            response.set_data(b'')
+            del response.headers['Content-Length']
+            return response
+        return None
+
+    def _encode(self, response, page=None):
+        """Compress a response body for the client, reusing a cached page's compressed copies"""
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        encoding = next((e for e in _encodings() if request.accept_encodings[e]), None)
+        body = page.body if page is not None else response.get_data()
+        if encoding is None or len(body) < self.min_size:
+            return response
+
+        if page is not None:
+            compressed = page.encoded.get(encoding)
+            if compressed is None:
+                compressed = page.encoded[encoding] = _compress(body, encoding)
+        else:
+            compressed = _compress(body, encoding)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def _purge(self, tags):
+        self.store.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.store),
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+page_cache = PageCache()
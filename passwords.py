@@ -0,0 +1,120 @@
+# passwords.py - Password hashing off the request thread, with admission control
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt as _bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many hashes are queued to accept another, or one took too long"""
+
+    retry_after = 5  # seconds, for the Retry-After header of the 503
+
+
+def _werkzeug_method(method, cost):
+    if method == 'pbkdf2:sha256':
+        return f'pbkdf2:sha256:{cost}'
+    if method == 'scrypt':
+        return f'scrypt:{cost}:8:1'
+    raise ValueError(f'Unknown password hash method: {method}')
+
+
+def _bcrypt_input(password):
+    # bcrypt only takes 72 bytes (and bcrypt 5 raises past that), so longer
+    # passwords are hashed down first; shorter ones are used as they are
+    data = password.encode('utf-8')
+    if len(data) > 72:
+        data = base64.b64encode(hashlib.sha256(data).digest())
+    return data
+
+
+def _hash(method, cost, password):
+    if method == 'bcrypt':
+        return _bcrypt.hashpw(_bcrypt_input(password), _bcrypt.gensalt(rounds=cost)).decode('utf-8')
+    return generate_password_hash(password, method=_werkzeug_method(method, cost))
+
+
+def _check(stored, password):
+    if stored.startswith('$2'):
+        return _bcrypt.checkpw(_bcrypt_input(password), stored.encode('utf-8'))
+    return check_password_hash(stored, password)
+
+
+class PasswordService:
+    """Hashes and verifies passwords in a bounded worker pool.
+
+    PASSWORD_HASH_METHOD is pbkdf2:sha256 (cost = iterations), scrypt
+    (cost = N) or bcrypt (cost = log rounds). At most PASSWORD_HASH_WORKERS
+    hashes run at once and PASSWORD_HASH_QUEUE may wait; past that, or
+    when a hash doesn't finish within PASSWORD_HASH_TIMEOUT, PasswordServiceBusy
+    is raised, so a login burst can't starve other requests of CPU.
+    """
+
+    def __init__(self):
+        self.method = 'pbkdf2:sha256'
+        self.cost = 600000
+        self.timeout = 30
+        self._executor = None
+        self._admission = None
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.cost = app.config.get('PASSWORD_HASH_COST', self.cost)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        queue = app.config.get('PASSWORD_HASH_QUEUE', workers * 4)
+        # hashlib and bcrypt release the GIL while hashing, so threads run in
+        # parallel; a process pool is available for anything that doesn't
+        if app.config.get('PASSWORD_HASH_EXECUTOR', 'thread') == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._admission = threading.BoundedSemaphore(workers + queue)
+        app.extensions['passwords'] = self
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        if not self._admission.acquire(blocking=False):
+            raise PasswordServiceBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._admission.release()
+            raise
+        # The slot is freed when the hash is done, not when we stop waiting,
+        # so hashes abandoned after a timeout still count against the bound
+        future.add_done_callback(lambda _: self._admission.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise PasswordServiceBusy()
+
+    def hash(self, password):
+        return self._run(_hash, self.method, self.cost, password)
+
+    def verify(self, stored, password):
+        """Check a password; returns (matches, new_hash).
+
+        new_hash is set when the password matched but was stored with an
+        outdated method or cost, and should replace the stored hash.
+        """
+        if not stored or not self._run(_check, stored, password):
+            return False, None
+        if self.needs_rehash(stored):
+            return True, self.hash(password)
+        return True, None
+
+    def needs_rehash(self, stored):
+        if self.method == 'bcrypt':
+            if not stored.startswith('$2'):
+                return True
+            return int(stored.split('$')[2]) != self.cost
+        return stored.split('$', 1)[0] != _werkzeug_method(self.method, self.cost)
+
+
+passwords = PasswordService()
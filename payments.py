@@ -0,0 +1,89 @@
+# payments.py - Payment providers used by the charge_order job
+from collections import namedtuple, deque
+
+from flask import current_app
+
+PaymentResult = namedtuple('PaymentResult', 'succeeded reference')
+
+# Checkout payment methods the provider charges; the rest are paid outside the site
+CHARGED_METHODS = {'card'}
+
+
+class PaymentDeclined(Exception):
+    """The provider refused the charge; retrying won't help"""
+
+
+class PaymentPending(Exception):
+    """The provider hasn't settled the charge yet; the job retries and looks again"""
+
+
+class StubPaymentProvider:
+    """Local stand-in that approves every charge (or declines all of them)"""
+
+    def __init__(self, decline=False, keep=100):
+        self.decline = decline
+        self.charges = deque(maxlen=keep)  # ids of the most recent charged orders
+
+    def charge(self, order):
+        if self.decline:
+            raise PaymentDeclined(f'Stub declined order {order.id}')
+        self.charges.append(order.id)
+        return PaymentResult(True, f'stub_{order.id}')
+
+
+class StripePaymentProvider:
+    """Charges the card of a 'card' order.
+
+    The checkout page collects the card with Stripe.js when
+    STRIPE_PUBLISHABLE_KEY is set and posts its PaymentMethod id, kept in
+    order.payment_token. The intent is created and confirmed in one call,
+    off session, as the customer has left by the time the job runs.
+    """
+
+    # Intents that will never succeed without the customer
+    FAILED = {'canceled', 'requires_payment_method', 'requires_action'}
+
+    def __init__(self, api_key, currency='inr'):
+        import stripe
+        stripe.api_key = api_key
+        self.stripe = stripe
+        self.currency = currency
+
+    def charge(self, order):
+        if not (order.payment_token or '').startswith('pm_'):
+            raise PaymentDeclined(f'Order {order.id} has no card to charge')
+        try:
+            intent = self.stripe.PaymentIntent.create(
+                amount=round(order.total_amount * 100),
+                currency=self.currency,
+                payment_method=order.payment_token,
+                confirm=True,
+                off_session=True,
+                metadata={'order_id': order.id},
+                # A retried job must not charge twice
+                idempotency_key=f'order-{order.id}',
+            )
+            if intent.status != 'succeeded':
+                # A retry replays the first response; ask for the current state
+                intent = self.stripe.PaymentIntent.retrieve(intent.id)
+        except self.stripe.error.CardError as e:
+            raise PaymentDeclined(str(e))
+        if intent.status in self.FAILED:
+            raise PaymentDeclined(f'Payment {intent.id} is {intent.status}')
+        return PaymentResult(intent.status == 'succeeded', intent.id)
+
+
+_providers = {}
+
+
+def payment_provider():
+    """The provider named by PAYMENT_PROVIDER ('stub' or 'stripe'), one per app"""
+    app = current_app._get_current_object()
+    provider = _providers.get(app)
+    if provider is None:
+        if app.config['PAYMENT_PROVIDER'] == 'stripe':
+            provider = StripePaymentProvider(app.config['STRIPE_SECRET_KEY'], app.config['PAYMENT_CURRENCY'])
+        else:
+            provider = StubPaymentProvider(decline=app.config.get('PAYMENT_STUB_DECLINE', False))
+        _providers[app] = provider
+    return provider
@@ -0,0 +1,254 @@
+# recommend.py - Precomputed "similar items" for wildlife and safaris
+import re
+import math
+import time
+import logging
+import threading
+
+import numpy as np
+from flask import current_app
+from scipy import sparse
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from models import db, Wildlife, Safari
+from cache import on_catalog_commit
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset('''
+    a an and are as at be by for from has have in is it its of on or that the
+    this to was were with into their there which while your you
+'''.split())
+
+# Keep the term space bounded so the scored blocks stay small for large catalogs
+MAX_FEATURES = 2048
+# Rows scored against the whole catalog at once while building
+BLOCK_SIZE = 256
+
+
+def tokenize(text):
+    return [
+        token for token in TOKEN_PATTERN.findall((text or '').lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def tfidf_matrix(documents, max_features=MAX_FEATURES):
+    """L2-normalised TF-IDF vectors (sublinear tf, smoothed idf), one sparse CSR row per document"""
+    doc_freq = {}
+    counts = []
+    for tokens in documents:
+        tf = {}
+        for token in tokens:
+            tf[token] = tf.get(token, 0) + 1
+        counts.append(tf)
+        for token in tf:
+            doc_freq[token] = doc_freq.get(token, 0) + 1
+
+    vocabulary = sorted(doc_freq, key=lambda token: (-doc_freq[token], token))[:max_features]
+    columns = {token: i for i, token in enumerate(vocabulary)}
+    n = len(documents)
+    idf = np.array([math.log((1 + n) / (1 + doc_freq[token])) + 1 for token in vocabulary], dtype=np.float32)
+
+    indptr = [0]
+    indices = []
+    data = []
+    for tf in counts:
+        for token, count in tf.items():
+            column = columns.get(token)
+            if column is not None:
+                indices.append(column)
+                data.append(1 + math.log(count))
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(n, len(vocabulary))
+    )
+
+    # Weight and normalise the stored values in place; documents have a few
+    # dozen terms each, so the matrix is a small fraction of n x vocabulary
+    matrix.data *= idf[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float32).ravel())
+    norms[norms == 0] = 1
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+    return matrix
+
+
+def top_neighbours(vectors, groups, top_k, group_weight):
+    """Indices of each row's top_k most similar rows, best first.
+
+    Similarity is text cosine plus group_weight when both rows share a group.
+    """
+    n = vectors.shape[0]
+    k = min(top_k, n - 1)
+    if k <= 0:
+        return [[] for _ in range(n)]
+
+    neighbours = []
+    for start in range(0, n, BLOCK_SIZE):
+        block = slice(start, min(start + BLOCK_SIZE, n))
+        # Sparse catalog times a dense block: only block x n scores are dense
+        scores = np.ascontiguousarray((vectors @ vectors[block].toarray().T).T)
+        scores += group_weight * (groups[block, None] == groups[None, :])
+        # Never recommend an item for itself
+        rows = np.arange(block.start, block.stop)
+        scores[rows - start, rows] = -np.inf
+
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        for i, row in enumerate(candidates):
+            order = np.argsort(-scores[i, row], kind='stable')
+            neighbours.append(row[order].tolist())
+    return neighbours
+
+
+class SimilarityIndex:
+    """Top-k similar items for every row of one catalog model, kept in memory.
+
+    Rows are loaded once and detached from the session, so similar() needs
+    no query. The index is built in a background thread when the app starts
+    serving (`flask serve` builds it before forking instead); similar()
+    returns None until it is ready, and callers fall back to a category
+    query. It is rebuilt in the background after catalog commits; the
+    previous index keeps serving until the new one is ready. Commits
+    made by other processes (other server workers, `flask import-catalog`)
+    are noticed by comparing the catalog's version with the one the index
+    was built from, at most once every check_interval seconds.
+    """
+
+    def __init__(self, model, name, text, group, top_k=3, group_weight=0.3):
+        self.model = model
+        self.name = name
+        self.text = text
+        self.group = group
+        self.top_k = top_k
+        self.group_weight = group_weight
+        self.check_interval = 30
+        self._neighbours = {}
+        self._built = False
+        self._version = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+        self._rebuild_pending = False
+        self._rebuilding = False
+
+    def version(self, session):
+        """Changes whenever a row is added, edited or deleted"""
+        model = self.model
+        return tuple(session.execute(select(func.count(), func.max(model.id), func.max(model.updated_at))).one())
+
+    def build(self):
+        """Load every row and recompute all neighbour lists (needs an app context)"""
+        # A private session, so the request session is left alone and the rows
+        # come out detached once it closes
+        with Session(db.engine) as session:
+            version = self.version(session)
+            rows = session.query(self.model).order_by(self.model.id).all()
+
+        vectors = tfidf_matrix([tokenize(self.text(row)) for row in rows])
+        group_values = {}
+        groups = np.array([group_values.setdefault(self.group(row), len(group_values)) for row in rows])
+        neighbours = top_neighbours(vectors, groups, self.top_k, self.group_weight)
+
+        self._neighbours = {
+            row.id: [rows[i] for i in neighbour_rows]
+            for row, neighbour_rows in zip(rows, neighbours)
+        }
+        self._version = version
+        self._checked_at = time.monotonic()
+        self._built = True
+        logger.info('Built %s similarity index for %d rows', self.name, len(rows))
+
+    def similar(self, id, limit=None):
+        """Precomputed neighbours of a row, or None if the row isn't indexed yet"""
+        if not self._built:
+            # Never build in a request; the caller has a cheaper fallback
+            self.schedule_rebuild(current_app._get_current_object())
+            return None
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._check_version()
+        neighbours = self._neighbours.get(id)
+        if neighbours is None:
+            return None
+        return neighbours[:limit or self.top_k]
+
+    def _check_version(self):
+        # Claim the check first so concurrent requests don't all run it
+        self._checked_at = time.monotonic()
+        if self.version(db.session) != self._version:
+            self.schedule_rebuild(current_app._get_current_object())
+
+    def schedule_rebuild(self, app):
+        """Rebuild in a background thread; bursts of writes collapse into one rebuild"""
+        with self._lock:
+            self._rebuild_pending = True
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_loop, args=(app,), daemon=True,
+                         name=f'{self.name}-similarity').start()
+
+    def _rebuild_loop(self, app):
+        try:
+            while True:
+                with self._lock:
+                    if not self._rebuild_pending:
+                        self._rebuilding = False
+                        return
+                    self._rebuild_pending = False
+                with app.app_context():
+                    self.build()
+        except Exception:
+            logger.exception('Rebuilding %s similarity index failed', self.name)
+            with self._lock:
+                self._rebuilding = False
+
+
+class Recommendations:
+    def __init__(self):
+        self.indexes = {
+            'wildlife': SimilarityIndex(
+                Wildlife, 'wildlife',
+                # Title words count double
+                text=lambda w: f'{w.title} {w.title} {w.description} {w.location or ""}',
+                group=lambda w: w.category,
+            ),
+            'safari': SimilarityIndex(
+                Safari, 'safari',
+                text=lambda s: f'{s.name} {s.name} {s.description or ""} {s.duration or ""}',
+                group=lambda s: s.tier,
+            ),
+        }
+        self.app = None
+
+    def init_app(self, app):
+        self.app = app
+        for index in self.indexes.values():
+            index.top_k = app.config.get('SIMILAR_ITEMS', index.top_k)
+            index.check_interval = app.config.get('SIMILAR_ITEMS_CHECK_SECONDS', index.check_interval)
+        app.extensions['recommendations'] = self
+        on_catalog_commit(self._catalog_changed)
+        if not app.testing:
+            app.before_request(self._build_in_background)
+
+    def build_all(self):
+        for index in self.indexes.values():
+            index.build()
+
+    def similar(self, name, id, limit=None):
+        return self.indexes[name].similar(id, limit)
+
+    def _build_in_background(self):
+        # Start building as soon as the app serves, before any detail page asks
+        for index in self.indexes.values():
+            if not index._built:
+                index.schedule_rebuild(current_app._get_current_object())
+
+    def _catalog_changed(self, tags):
+        for name, index in self.indexes.items():
+            if name in tags:
+                index.schedule_rebuild(self.app)
+
+
+recommendations = Recommendations()
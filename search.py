@@ -0,0 +1,109 @@
+# search.py - Full-text search over the wildlife catalog
+from sqlalchemy import event, table, column, text
+
+from models import db, Wildlife
+
+GALLERY_PER_PAGE = 12
+
+# External-content FTS5 index over wildlife(title, description, location).
+# Triggers keep it in step with every insert, update and delete on the table.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS wildlife_fts USING fts5(
+        title, description, location,
+        content='wildlife', content_rowid='id',
+        tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS wildlife_fts_insert AFTER INSERT ON wildlife BEGIN
+        INSERT INTO wildlife_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS wildlife_fts_delete AFTER DELETE ON wildlife BEGIN
+        INSERT INTO wildlife_fts(wildlife_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS wildlife_fts_update AFTER UPDATE ON wildlife BEGIN
+        INSERT INTO wildlife_fts(wildlife_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO wildlife_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END""",
+]
+
+# Rank title matches above location matches above description matches
+SEARCH_RANK = "bm25(10.0, 1.0, 4.0)"
+
+wildlife_fts = table('wildlife_fts', column('rowid'), column('rank'))
+
+_index_ready = False
+
+
+def search_index_supported(bind=None):
+    return (bind or db.engine).dialect.name == 'sqlite'
+
+
+def init_search_index(connection=None):
+    """Create the wildlife search index and its triggers if they don't exist yet.
+
+    A freshly created index is filled from the existing wildlife rows.
+    """
+    global _index_ready
+
+    def create(conn):
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'wildlife_fts'"
+        )).first()
+        for statement in SEARCH_INDEX_DDL:
+            conn.execute(text(statement))
+        if not exists:
+            conn.execute(text("INSERT INTO wildlife_fts(wildlife_fts) VALUES ('rebuild')"))
+            conn.execute(text(
+                "INSERT INTO wildlife_fts(wildlife_fts, rank) VALUES ('rank', :rank)"
+            ), {'rank': SEARCH_RANK})
+
+    if connection is not None:
+        create(connection)
+    else:
+        with db.engine.begin() as conn:
+            create(conn)
+    _index_ready = True
+
+
+@event.listens_for(Wildlife.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    if search_index_supported(connection):
+        init_search_index(connection)
+
+
+def build_match_query(q):
+    """Turn free text into an FTS5 query: every word must match, as a prefix"""
+    terms = [term.replace('"', '""') for term in q.split()]
+    return ' '.join(f'"{term}"*' for term in terms if term)
+
+
+def search_wildlife(q='', category='', page=1, per_page=GALLERY_PER_PAGE):
+    """Return one page of wildlife matching the search text and category, best match first"""
+    query = Wildlife.query
+
+    if category:
+        query = query.filter(Wildlife.category == category)
+
+    match = build_match_query(q)
+    if match and search_index_supported():
+        if not _index_ready:
+            init_search_index()
+        query = query.join(wildlife_fts, wildlife_fts.c.rowid == Wildlife.id) \
+            .filter(text('wildlife_fts MATCH :match').bindparams(match=match)) \
+            .order_by(wildlife_fts.c.rank, Wildlife.id)
+    elif match:
+        for term in q.split():
+            pattern = f'%{term}%'
+            query = query.filter(db.or_(
+                Wildlife.title.ilike(pattern),
+                Wildlife.description.ilike(pattern),
+                Wildlife.location.ilike(pattern)
+            ))
+        query = query.order_by(Wildlife.title, Wildlife.id)
+    else:
+        query = query.order_by(Wildlife.id)
+
+    return query.paginate(page=page, per_page=per_page, error_out=False)
@@ -0,0 +1,86 @@
+# server.py - Prefork production server (gunicorn) with warmup
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from models import db
+from recommend import recommendations
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers():
+    return (os.cpu_count() or 1) * 2 + 1
+
+
+def preload(app):
+    """Work done once in the master before forking, so every worker shares the result.
+
+    Compiles every template (from the bytecode cache after the first
+    deploy) and builds the similarity indexes; then closes
+    the master's database connections, which must not be used by children.
+    """
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.app_context():
+        recommendations.build_all()
+        db.engine.dispose()
+    app.extensions['warmed_up'] = False
+
+
+def warm_worker(app, connections=1):
+    """Open a worker's own database connections; /readyz passes once this is done"""
+    with app.app_context():
+        engine = db.engine
+        # Connections inherited from the master belong to it
+        engine.dispose(close=False)
+
+        def ping(_):
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+
+        # Check out several at once so the pool really holds that many
+        with ThreadPoolExecutor(max_workers=connections) as pool:
+            list(pool.map(ping, range(connections)))
+    app.extensions['warmed_up'] = True
+
+
+def serve(app, bind, workers, threads, max_requests, max_requests_jitter, timeout, graceful_timeout):
+    """Run the app under gunicorn with preloading, warm workers and request-count recycling.
+
+    kill -HUP <master> replaces the workers gracefully with fresh ones of
+    the same code; to deploy new code send USR2 (starts a new master) and
+    then TERM to the old master.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    def post_fork(server, worker):
+        warm_worker(app, connections=threads)
+        logger.info('Worker %s warmed up', worker.pid)
+
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'preload_app': True,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests_jitter,
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'post_fork': post_fork,
+        'accesslog': '-',
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            preload(app)
+            return app
+
+    Server().run()
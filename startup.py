@@ -0,0 +1,101 @@
+# startup.py - Where process start-up time goes: imports, app set-up and first responses
+import os
+import re
+import sys
+import json
+import time
+import subprocess
+from collections import defaultdict
+
+from jinja2 import FileSystemBytecodeCache
+
+# -X importtime lines: "import time: <self us> | <cumulative us> | <indent><module>"
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+# Run in a fresh interpreter so nothing is imported or compiled yet
+PROBE = '''
+import sys, json, time
+start = time.perf_counter()
+import app as module
+imported = time.perf_counter() - start
+client = module.app.test_client()
+responses = []
+for path in sys.argv[1:]:
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        status = client.get(path).status_code
+        timings.append(time.perf_counter() - start)
+    responses.append([path, status] + timings)
+print(json.dumps({'import': imported, 'init': module.app.extensions['startup_timings'], 'responses': responses}))
+'''
+
+
+def timed_init(app, steps):
+    """Call each (name, init) in order with the app, recording the seconds each took.
+
+    The timings are kept in app.extensions['startup_timings'] for
+    `flask profile-startup`.
+    """
+    timings = app.extensions.setdefault('startup_timings', [])
+    for name, init in steps:
+        start = time.perf_counter()
+        init(app)
+        timings.append((name, time.perf_counter() - start))
+
+
+def template_bytecode_cache(app):
+    """A Jinja bytecode cache in TEMPLATE_BYTECODE_CACHE under the instance folder, or None.
+
+    Compiled templates are written there on first use and loaded by every
+    later process instead of parsing the source again; an edited template
+    no longer matches its checksum and is recompiled.
+    """
+    directory = app.config.get('TEMPLATE_BYTECODE_CACHE')
+    if not directory:
+        return None
+    directory = os.path.join(app.instance_path, directory)
+    os.makedirs(directory, exist_ok=True)
+    return FileSystemBytecodeCache(directory)
+
+
+def _import_times(lines, root):
+    """{top-level module: (self, cumulative) seconds}, repo modules by their own name"""
+    local = {os.path.splitext(name)[0] for name in os.listdir(root) if name.endswith('.py')}
+    self_times = defaultdict(int)
+    cumulative = {}
+    for line in lines:
+        match = IMPORT_TIME.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        package = name.split('.')[0]
+        self_times[package] += int(self_us)
+        # The outermost import of a package covers everything it pulled in
+        if name == package:
+            cumulative[package] = max(cumulative.get(package, 0), int(cumulative_us))
+    return {
+        package: (self_times[package] / 1e6, cumulative.get(package, self_times[package]) / 1e6, package in local)
+        for package in self_times
+    }
+
+
+def profile_startup(root, paths=('/',), env=None):
+    """Start the app in a new interpreter and measure it.
+
+    Returns a dict with 'imports' ({module: (self, cumulative, is_repo_module)}),
+    'import' (seconds to import app.py, including create_app), 'init'
+    ([(step, seconds)] from create_app) and 'responses' ([(path, status,
+    first, second)]), all in seconds. Each path is requested twice so the
+    first, cold response can be compared with a warm one.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, *paths],
+        cwd=root, env={**os.environ, **(env or {})}, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'probe failed')
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['imports'] = _import_times(result.stderr.splitlines(), root)
+    return report
@@ -3,6 +3,17 @@
 // Global variables
 let cartCount = 0;
 
+// Cart changes wait here and go to /cart/batch together, so a burst of
+// clicks costs one request instead of one each
+const cartQueue = {
+    operations: [],
+    timer: null,
+    firstQueuedAt: 0,
+    sending: false,
+    delay: 400,      // ms of quiet before sending
+    maxWait: 2000    // ms before sending anyway while clicks keep coming
+};
+
 // Document ready
 $(document).ready(function() {
     initializeTooltips();
@@ -34,6 +45,14 @@ function setupEventListeners() {
         updateCartItem(itemId, action);
     });
 
+    $(document).on('click', '.remove-cart-item', function(e) {
+        e.preventDefault();
+        removeCartItem($(this).data('item-id'));
+    });
+
+    // Don't lose changes still waiting when the user leaves the page
+    $(window).on('pagehide', flushCartQueueOnExit);
+
     // Payment method selection
     $(document).on('click', '.payment-method', function() {
         $('.payment-method').removeClass('selected');
@@ -60,100 +79,148 @@ function addToCart(productId, productType) {
         return;
     }
 
+    queueCartOperation({ op: 'add', product_type: productType, product_id: productId, quantity: 1 });
+    updateCartCount(cartCount + 1);
+
+    // Show how many are on their way instead of blocking further clicks
+    const button = $(`.add-to-cart[data-id="${productId}"][data-type="${productType}"]`);
+    const added = (button.data('added') || 0) + 1;
+    button.data('added', added)
+        .html(`<i class="fas fa-check me-2"></i>Added${added > 1 ? ' (' + added + ')' : ''}`)
+        .removeClass('btn-success')
+        .addClass('btn-secondary');
+
+    clearTimeout(button.data('resetTimer'));
+    button.data('resetTimer', setTimeout(() => {
+        button.data('added', 0)
+            .html('<i class="fas fa-cart-plus me-2"></i>Add to Cart')
+            .removeClass('btn-secondary')
+            .addClass('btn-success');
+    }, 2000));
+}
+
+// Update cart item quantity
+function updateCartItem(itemId, action) {
+    const quantityEl = $(`#quantity-${itemId}`);
+    const quantity = Math.max(1, (parseInt(quantityEl.text()) || 1) + (action === 'increase' ? 1 : -1));
+
+    quantityEl.text(quantity);
+    $(`.quantity-btn.decrease[data-item-id="${itemId}"]`).prop('disabled', quantity <= 1);
+    queueCartOperation({ op: 'set', item_id: itemId, quantity: quantity });
+}
+
+// Remove item from cart
+function removeCartItem(itemId) {
+    if (confirm('Are you sure you want to remove this item?')) {
+        $(`#cart-item-${itemId}`).fadeOut(200);
+        queueCartOperation({ op: 'remove', item_id: itemId });
+    }
+}
+
+// Merge an operation into the queue: repeated adds of a product become one
+// add, and only the last set or remove of an item is kept
+function queueCartOperation(operation) {
+    const queued = cartQueue.operations;
+    if (operation.op === 'add') {
+        const existing = queued.find(o => o.op === 'add' &&
+            o.product_type === operation.product_type && o.product_id === operation.product_id);
+        if (existing) {
+            existing.quantity += operation.quantity;
+        } else {
+            queued.push(operation);
+        }
+    } else {
+        cartQueue.operations = queued.filter(o => o.op === 'add' || o.item_id !== operation.item_id);
+        cartQueue.operations.push(operation);
+    }
+
+    if (!cartQueue.firstQueuedAt) {
+        cartQueue.firstQueuedAt = Date.now();
+    }
+    scheduleCartFlush();
+}
+
+function scheduleCartFlush() {
+    clearTimeout(cartQueue.timer);
+    const waited = Date.now() - cartQueue.firstQueuedAt;
+    cartQueue.timer = setTimeout(flushCartQueue, Math.max(0, Math.min(cartQueue.delay, cartQueue.maxWait - waited)));
+}
+
+// Send everything queued in one request; changes made meanwhile wait for
+// the next one so requests never overlap
+function flushCartQueue() {
+    if (cartQueue.sending || !cartQueue.operations.length) {
+        return;
+    }
+
+    const operations = cartQueue.operations;
+    cartQueue.operations = [];
+    cartQueue.firstQueuedAt = 0;
+    cartQueue.sending = true;
+
     $.ajax({
-        url: '/cart/add',
+        url: '/cart/batch',
         type: 'POST',
         contentType: 'application/json',
-        data: JSON.stringify({
-            product_id: productId,
-            product_type: productType
-        }),
-        beforeSend: function() {
-            showLoader();
-        },
+        data: JSON.stringify({ operations: operations }),
         success: function(response) {
-            if (response.success) {
-                updateCartCount(response.cart_count);
-                showAlert('Item added to cart successfully!', 'success');
-
-                // Update button state
-                $(`.add-to-cart[data-id="${productId}"][data-type="${productType}"]`)
-                    .html('<i class="fas fa-check me-2"></i>Added')
-                    .removeClass('btn-success')
-                    .addClass('btn-secondary')
-                    .prop('disabled', true);
-
-                // Reset after 2 seconds
-                setTimeout(() => {
-                    $(`.add-to-cart[data-id="${productId}"][data-type="${productType}"]`)
-                        .html('<i class="fas fa-cart-plus me-2"></i>Add to Cart')
-                        .removeClass('btn-secondary')
-                        .addClass('btn-success')
-                        .prop('disabled', false);
-                }, 2000);
-            } else {
-                showAlert(response.message || 'Error adding to cart', 'danger');
-            }
+            applyCartSummary(response);
         },
         error: function(xhr) {
             if (xhr.status === 401) {
                 showAlert('Please login to add items to cart', 'warning', true);
             } else {
-                showAlert('Error adding item to cart', 'danger');
+                const response = xhr.responseJSON || {};
+                showAlert(response.message || 'Error updating cart', 'danger');
+            }
+            // What the page shows may be wrong now; start again from the server's cart
+            if ($('#cartSubtotal').length) {
+                location.reload();
             }
         },
         complete: function() {
-            hideLoader();
+            cartQueue.sending = false;
+            if (cartQueue.operations.length) {
+                scheduleCartFlush();
+            }
         }
     });
 }
 
-// Update cart item quantity
-function updateCartItem(itemId, action) {
-    $.ajax({
-        url: `/cart/update/${itemId}`,
-        type: 'POST',
-        data: { action: action },
-        success: function(response) {
-            location.reload(); // Reload to update totals
-        },
-        error: function() {
-            showAlert('Error updating cart', 'danger');
-        }
-    });
+function flushCartQueueOnExit() {
+    if (cartQueue.operations.length && navigator.sendBeacon) {
+        const body = new Blob([JSON.stringify({ operations: cartQueue.operations })], { type: 'application/json' });
+        navigator.sendBeacon('/cart/batch', body);
+        cartQueue.operations = [];
+    }
 }
 
-// Remove item from cart
-function removeCartItem(itemId) {
-    if (confirm('Are you sure you want to remove this item?')) {
-        $.ajax({
-            url: `/cart/remove/${itemId}`,
-            type: 'POST',
-            success: function(response) {
-                if (response.success) {
-                    showAlert('Item removed from cart', 'success');
-                    location.reload();
-                }
-            },
-            error: function() {
-                showAlert('Error removing item', 'danger');
-            }
-        });
+// Show the cart the server returned, unless more changes are already queued
+function applyCartSummary(response) {
+    if (cartQueue.operations.length) {
+        return;
+    }
+    updateCartCount(response.cart_count);
+
+    if (!$('#cartSubtotal').length) {
+        return;
+    }
+    if (!response.items.length && !$('.cart-item:visible').length) {
+        location.reload(); // Show the empty cart page
+        return;
     }
+    response.items.forEach(function(item) {
+        $(`#quantity-${item.id}`).text(item.quantity);
+        $(`#item-total-${item.id}`).text(formatCurrency(item.total));
+    });
+    $('#cartSubtotal').text(formatCurrency(response.subtotal));
+    $('#cartTax').text(formatCurrency(response.subtotal * 0.18));
+    $('#cartTotal').text(formatCurrency(response.subtotal * 1.18));
 }
 
-// Load cart count from server
+// Load cart count from the navbar badge rendered with the page
 function loadCartCount() {
-    if (isLoggedIn()) {
-        $.get('/cart/count', function(data) {
-            if (data.success) {
-                updateCartCount(data.count);
-            }
-        }).fail(function() {
-            // If API fails, check cart page
-            cartCount = parseInt($('#cartCount').text()) || 0;
-        });
-    }
+    cartCount = parseInt($('#cartCount').text()) || 0;
 }
 
 // Update cart count display
@@ -170,7 +237,8 @@ function updateCartCount(count) {
 
 // Check if user is logged in
 function isLoggedIn() {
-    return $('body').data('user-authenticated') === 'true';
+    // jQuery's .data() turns "true" into a boolean
+    return $('body').data('user-authenticated') === true;
 }
 
 // Show alert message
@@ -282,35 +350,6 @@ function togglePasswordVisibility(inputId, toggleButtonId) {
     }
 }
 
-// Filter wildlife/safari items
-function filterItems(category) {
-    $('.item-card').hide();
-    if (category === 'all') {
-        $('.item-card').show();
-    } else {
-        $(`.item-card[data-category="${category}"]`).show();
-    }
-
-    // Update active filter button
-    $('.filter-btn').removeClass('active');
-    $(`.filter-btn[data-filter="${category}"]`).addClass('active');
-}
-
-// Search functionality
-function searchItems(searchTerm) {
-    const term = searchTerm.toLowerCase();
-    $('.item-card').each(function() {
-        const title = $(this).data('title').toLowerCase();
-        const description = $(this).data('description').toLowerCase();
-
-        if (title.includes(term) || description.includes(term)) {
-            $(this).show();
-        } else {
-            $(this).hide();
-        }
-    });
-}
-
 // Smooth scroll to section
 function scrollToSection(sectionId) {
     $('html, body').animate({
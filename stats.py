@@ -0,0 +1,149 @@
+# stats.py - Dashboard counters and recent orders without COUNT(*) per page view
+import time
+import threading
+from collections import deque, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User, Wildlife, Safari, Order, SiteStat
+
+# Counter name for each counted model
+COUNTED_MODELS = {
+    Wildlife: 'total_wildlife',
+    Safari: 'total_safaris',
+    Order: 'total_orders',
+    User: 'total_users',
+}
+
+RecentOrder = namedtuple('RecentOrder', 'id user_id created_at total_amount payment_status')
+
+
+def _adjust(connection, model, delta):
+    # Runs inside the flush, so the counter commits or rolls back with the row
+    table = SiteStat.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.name == COUNTED_MODELS[model])
+        .values(value=table.c.value + delta)
+    )
+
+
+def _row_inserted(mapper, connection, target):
+    _adjust(connection, mapper.class_, 1)
+
+
+def _row_deleted(mapper, connection, target):
+    _adjust(connection, mapper.class_, -1)
+
+
+for _model in COUNTED_MODELS:
+    event.listen(_model, 'after_insert', _row_inserted)
+    event.listen(_model, 'after_delete', _row_deleted)
+
+
+def reconcile_counters():
+    """Recount every counted table and store the results"""
+    counts = {name: model.query.count() for model, name in COUNTED_MODELS.items()}
+    for name, value in counts.items():
+        stat = db.session.get(SiteStat, name)
+        if stat is None:
+            db.session.add(SiteStat(name=name, value=value))
+        else:
+            stat.value = value
+    db.session.commit()
+    return counts
+
+
+def get_counters():
+    """Current totals from the stats table, reconciling once if a counter is missing"""
+    counters = {stat.name: stat.value for stat in SiteStat.query.all()}
+    if any(name not in counters for name in COUNTED_MODELS.values()):
+        counters = reconcile_counters()
+    return counters
+
+
+class RecentOrders:
+    """Ring buffer of the newest orders, updated as orders are committed.
+
+    Orders committed by other worker processes show up when the buffer is
+    reloaded, at most refresh_interval seconds later.
+    """
+
+    def __init__(self, size=5, refresh_interval=60):
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self._orders = deque(maxlen=size)
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def latest(self):
+        with self._lock:
+            stale = self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+        if stale:
+            self.reload()
+        with self._lock:
+            return list(reversed(self._orders))
+
+    def reload(self):
+        orders = Order.query.order_by(Order.created_at.desc(), Order.id.desc()).limit(self.size).all()
+        with self._lock:
+            self._orders.clear()
+            self._orders.extend(_snapshot(order) for order in reversed(orders))
+            self._loaded_at = time.monotonic()
+
+    def record(self, snapshots):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for snapshot in snapshots:
+                existing = [i for i, order in enumerate(self._orders) if order.id == snapshot.id]
+                if existing:
+                    self._orders[existing[0]] = snapshot
+                elif not self._orders or _order_key(snapshot) > _order_key(self._orders[-1]):
+                    # Anything older than the newest buffered order is already
+                    # in the buffer or was never among the newest
+                    self._orders.append(snapshot)
+
+    def forget(self, order_ids):
+        with self._lock:
+            kept = [order for order in self._orders if order.id not in order_ids]
+            if len(kept) != len(self._orders):
+                # Let the next read refill the buffer from the database
+                self._loaded_at = None
+            self._orders.clear()
+            self._orders.extend(kept)
+
+
+recent_orders = RecentOrders()
+
+
+def _order_key(order):
+    return (order.created_at, order.id)
+
+
+def _snapshot(order):
+    return RecentOrder(order.id, order.user_id, order.created_at, order.total_amount, order.payment_status)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_orders(session, flush_context):
+    pending = session.info.setdefault('recent_orders', {'changed': [], 'deleted': set()})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Order):
+            pending['changed'].append(_snapshot(obj))
+    pending['deleted'].update(obj.id for obj in session.deleted if isinstance(obj, Order))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_orders(session):
+    pending = session.info.pop('recent_orders', None)
+    if pending:
+        if pending['deleted']:
+            recent_orders.forget(pending['deleted'])
+        recent_orders.record(pending['changed'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_orders(session):
+    session.info.pop('recent_orders', None)
@@ -0,0 +1,134 @@
+# storage.py - Content-addressed store for uploaded images
+import os
+import re
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+
+try:
+    import fcntl
+except ImportError:  # Windows: releases aren't guarded against concurrent uploads
+    fcntl = None
+
+from models import db, Wildlife, Safari
+
+CHUNK_SIZE = 64 * 1024
+
+# Stored names are the first 32 hex digits of the SHA-256 of the content plus
+# the original extension, so a name always refers to the same bytes.
+FINGERPRINT_LENGTH = 32
+FINGERPRINTED_NAME = re.compile(r'^[0-9a-f]{%d}\.' % FINGERPRINT_LENGTH)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Held shared by uploads until they commit and exclusively by releases
+LOCK_FILE = '.lock'
+
+# Image columns that reference files in the store
+IMAGE_COLUMNS = [Wildlife.image_url, Safari.image_url]
+
+
+def is_fingerprinted(filename):
+    return bool(FINGERPRINTED_NAME.match(os.path.basename(filename)))
+
+
+def store_upload(file, upload_folder):
+    """Save an uploaded file under the hash of its contents.
+
+    The hash is computed while the upload streams to a temporary file. Returns
+    (filename, created), where created is False if identical content was
+    already stored.
+    """
+    _, ext = os.path.splitext(secure_filename(file.filename or ''))
+    digest = hashlib.sha256()
+
+    os.makedirs(upload_folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp.write(chunk)
+
+        filename = digest.hexdigest()[:FINGERPRINT_LENGTH] + ext.lower()
+        path = os.path.join(upload_folder, filename)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            return filename, False
+
+        os.replace(temp_path, path)
+        return filename, True
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def reference_count(filename):
+    """Number of catalog rows whose image is this stored file, as committed right now"""
+    # A connection of its own, so no snapshot taken earlier in the session hides a new row
+    with db.engine.connect() as conn:
+        return sum(
+            conn.execute(select(func.count()).where(column == filename)).scalar()
+            for column in IMAGE_COLUMNS
+        )
+
+
+@contextmanager
+def upload_lock(upload_folder, shared=False):
+    """A lock on the store shared by every process that uses the folder"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(upload_folder, exist_ok=True)
+    with open(os.path.join(upload_folder, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield  # closing the file drops the lock
+
+
+def hold_upload_lock(session, upload_folder):
+    """Keep stored files from being released until the session's transaction ends.
+
+    Call before using a stored file in a row: a file that was already
+    stored may be unreferenced until this transaction commits.
+    """
+    if fcntl is None or 'upload_lock' in session.info:
+        return
+    lock = upload_lock(upload_folder, shared=True)
+    lock.__enter__()
+    session.info['upload_lock'] = lock
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _drop_upload_lock(session, transaction):
+    if transaction.parent is None and 'upload_lock' in session.info:
+        session.info.pop('upload_lock').__exit__(None, None, None)
+
+
+def release_upload(filename, upload_folder):
+    """Delete a stored file once no catalog row references it anymore.
+
+    Call after the change that dropped the reference has been committed.
+    Counting and deleting happen under the store lock, so an upload of the
+    same content that is about to reference the file again either commits
+    first (and is counted) or waits and stores the file anew. Returns True
+    if the file was deleted.
+    """
+    if not filename:
+        return False
+
+    with upload_lock(upload_folder):
+        if reference_count(filename) > 0:
+            return False
+        path = os.path.join(upload_folder, filename)
+        if not os.path.exists(path):
+            return False
+        os.remove(path)
+        return True
@@ -0,0 +1,49 @@
+# tasks.py - Job handlers for work moved out of request handlers
+from flask import current_app
+
+from models import db, Order
+from jobs import job, periodic
+from images import generate_derivatives, remove_derivatives
+from storage import release_upload
+from payments import payment_provider, PaymentDeclined, PaymentPending, CHARGED_METHODS
+from inventory import sweep_expired_holds
+
+
+@job('generate_derivatives', concurrency=2)
+def generate_image_derivatives(filename):
+    """Resize a newly stored upload; see images.DERIVATIVE_SIZES"""
+    generate_derivatives(current_app.config['UPLOAD_FOLDER'], filename)
+
+
+@job('release_image')
+def release_image(filename):
+    """Delete an image and its derivatives if no wildlife or safari uses it anymore"""
+    if release_upload(filename, current_app.config['UPLOAD_FOLDER']):
+        remove_derivatives(filename)
+
+
+@job('charge_order', concurrency=4, max_attempts=8)
+def charge_order(order_id):
+    """Take payment for a new order and record the outcome on it"""
+    order = db.session.get(Order, order_id)
+    if order is None or order.payment_status != 'pending':
+        return
+    if order.payment_method not in CHARGED_METHODS:
+        # Cash on delivery, UPI and PayPal are settled outside the site
+        return
+
+    # Anything but a decline raises, and the job is retried
+    try:
+        result = payment_provider().charge(order)
+    except PaymentDeclined:
+        order.payment_status = 'failed'
+        return
+    if not result.succeeded:
+        raise PaymentPending(f'Payment {result.reference} for order {order_id} is still processing')
+    order.payment_status = 'completed'
+
+
+@periodic('SEAT_HOLD_SWEEP_SECONDS')
+def sweep_seat_holds():
+    """Give the seats of abandoned carts back to their safari dates"""
+    sweep_expired_holds()
@@ -0,0 +1,51 @@
+# test_api.py - Conditional GETs on the JSON catalog API
+import pytest
+from sqlalchemy import event
+
+from models import db, Wildlife
+from stats import reconcile_counters
+
+
+@pytest.fixture
+def client(app):
+    db.session.add_all([
+        Wildlife(title=f'Tiger {i}', description='tiger forest', price=100 + i, category='Big Cats') for i in range(5)
+    ])
+    db.session.commit()
+    reconcile_counters()
+    return app.test_client()
+
+
+@pytest.fixture
+def queries(app):
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', listener)
+
+
+def test_matching_etag_is_answered_without_reading_the_page(client, queries):
+    etag = client.get('/api/wildlife?limit=2').headers['ETag']
+    queries.clear()
+
+    response = client.get('/api/wildlife?limit=2', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert len(queries) == 1
+
+
+@pytest.mark.parametrize('change', ['edit', 'delete'])
+def test_changes_give_a_new_etag(client, change):
+    etag = client.get('/api/wildlife?limit=2').headers['ETag']
+    wildlife = db.session.get(Wildlife, 4)
+    if change == 'edit':
+        wildlife.price += 1
+    else:
+        db.session.delete(wildlife)
+    db.session.commit()
+
+    response = client.get('/api/wildlife?limit=2', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert [item['id'] for item in response.get_json()['items']] == [1, 2]
@@ -0,0 +1,28 @@
+# test_catalog.py - Bulk catalog imports and the counters they leave behind
+import pytest
+
+import catalog
+from catalog import import_catalog, RowError
+from stats import get_counters
+
+
+def write_csv(tmp_path, rows):
+    path = tmp_path / 'wildlife.csv'
+    path.write_text('title,description,price\n' + ''.join(f'{row}\n' for row in rows))
+    return str(path)
+
+
+def test_import_recounts_the_counters(app, tmp_path):
+    result = import_catalog('wildlife', write_csv(tmp_path, ['Tiger,Bengal tiger,100', 'Leopard,Snow leopard,200']))
+
+    assert (result.inserted, result.updated, result.rejected) == (2, 0, 0)
+    assert get_counters()['total_wildlife'] == 2
+
+
+def test_failed_recount_does_not_hide_the_import_error(app, tmp_path, monkeypatch):
+    def broken_recount():
+        raise RuntimeError('database went away')
+    monkeypatch.setattr(catalog, 'reconcile_counters', broken_recount)
+
+    with pytest.raises(RowError, match='Too many invalid records'):
+        import_catalog('wildlife', write_csv(tmp_path, ['Tiger,,100', 'Leopard,,200']), max_errors=1)
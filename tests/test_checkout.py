@@ -0,0 +1,85 @@
+# test_checkout.py - Orders placed at checkout and paid by the charge_order job
+import pytest
+
+import payments
+from jobs import Worker
+from models import db, Order, User, Wildlife
+from passwords import passwords
+
+
+class RecordingProvider:
+    """Approves every charge and remembers the cards it was given"""
+
+    def __init__(self):
+        self.tokens = []
+
+    def charge(self, order):
+        self.tokens.append(order.payment_token)
+        return payments.PaymentResult(True, f'pi_{order.id}')
+
+
+@pytest.fixture
+def client(app):
+    db.session.add(User(email='buyer@example.com', password=passwords.hash('secret')))
+    db.session.add(Wildlife(title='Tiger', description='Bengal tiger', price=1200, category='Big Cats'))
+    db.session.commit()
+    client = app.test_client()
+    assert client.post('/login', data={'email': 'buyer@example.com', 'password': 'secret'}).status_code == 302
+    return client
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = RecordingProvider()
+    monkeypatch.setattr('tasks.payment_provider', lambda: provider)
+    return provider
+
+
+def place_order(client, **form):
+    wildlife_id = db.session.scalars(db.select(Wildlife.id)).one()
+    client.post('/cart/add', json={'product_id': wildlife_id, 'product_type': 'wildlife'})
+    response = client.post('/checkout', data={'address': '1 Forest Road', 'city': 'Nagpur', **form})
+    assert response.status_code == 302
+    return db.session.scalars(db.select(Order).order_by(Order.id.desc())).first()
+
+
+def test_card_order_is_charged_with_its_payment_method(app, client, provider):
+    order = place_order(client, payment_method='card', payment_token='pm_card_visa')
+
+    Worker(app).run_pending()
+
+    assert provider.tokens == ['pm_card_visa']
+    db.session.refresh(order)
+    assert order.payment_status == 'completed'
+
+
+@pytest.mark.parametrize('method', ['cod', 'upi', 'paypal'])
+def test_offline_payments_are_not_charged(app, client, provider, method):
+    # A stray token must not turn an offline payment into a card charge
+    order = place_order(client, payment_method=method, payment_token='pm_card_visa')
+
+    Worker(app).run_pending()
+
+    assert provider.tokens == []
+    db.session.refresh(order)
+    assert (order.payment_status, order.payment_token) == ('pending', None)
+
+
+def test_stripe_declines_a_card_order_without_a_card(app, client):
+    class FakeStripe:
+        class PaymentIntent:
+            @staticmethod
+            def create(**kwargs):
+                raise AssertionError('no intent without a card')
+
+    stripe = payments.StripePaymentProvider.__new__(payments.StripePaymentProvider)
+    stripe.stripe, stripe.currency = FakeStripe, 'inr'
+    payments._providers[app] = stripe
+    try:
+        order = place_order(client, payment_method='card')
+        Worker(app).run_pending()
+    finally:
+        del payments._providers[app]
+
+    db.session.refresh(order)
+    assert order.payment_status == 'failed'
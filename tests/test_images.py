@@ -0,0 +1,45 @@
+# test_images.py - Resized derivatives and the srcsets that point at them
+import pytest
+from PIL import Image
+
+import images
+from images import generate_derivatives, has_derivatives, image_srcset, remove_derivatives
+
+
+@pytest.fixture
+def upload(app, tmp_path):
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    Image.new('RGB', (500, 300), (200, 120, 40)).save(tmp_path / 'lion.jpg')
+    images._lookups.clear()
+    with app.test_request_context():
+        yield 'lion.jpg'
+    images._lookups.clear()
+
+
+def test_srcset_lists_only_widths_that_were_written(upload, tmp_path):
+    generate_derivatives(str(tmp_path), upload)
+
+    srcset = image_srcset(upload)
+    assert srcset.endswith('lion.jpg.card.jpg 500w')
+    assert ' 320w' in srcset
+    assert '640w' not in srcset and '1600w' not in srcset
+    with Image.open(tmp_path / 'derived' / 'lion.jpg.hero.webp') as hero:
+        assert hero.width == 500
+
+
+def test_lookups_are_remembered_including_misses(app, upload, tmp_path):
+    app.config['DERIVATIVES_CHECK_TTL'] = 60
+    assert not has_derivatives(upload)
+
+    # Written by another process (the job worker): this one keeps its answer until the TTL runs out
+    (tmp_path / 'derived').mkdir()
+    (tmp_path / 'derived' / 'lion.jpg.json').write_text('{"thumb": 320, "card": 500, "hero": 500}')
+    assert not has_derivatives(upload)
+
+    images._lookups.clear()
+    assert has_derivatives(upload)
+    (tmp_path / 'derived' / 'lion.jpg.json').unlink()
+    assert has_derivatives(upload)
+
+    remove_derivatives(upload)
+    assert not has_derivatives(upload)
@@ -0,0 +1,110 @@
+# test_jobs.py - Orders placed through the job queue and charged by an in-process worker
+import pytest
+
+import payments
+from jobs import Worker, enqueue
+from models import db, Job, Order, User
+
+
+@pytest.fixture
+def order(app):
+    user = User(email='buyer@example.com', password='x')
+    db.session.add(user)
+    db.session.flush()
+    order = Order(user_id=user.id, total_amount=2500, payment_status='pending', payment_method='card')
+    db.session.add(order)
+    db.session.flush()
+    enqueue('charge_order', {'order_id': order.id})
+    db.session.commit()
+    return order
+
+
+class FlakyProvider:
+    """Fails the first `failures` charges the way a network error would"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def charge(self, order):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('provider unreachable')
+        return payments.PaymentResult(True, f'flaky_{order.id}')
+
+
+class SlowProvider:
+    """Reports the first charge as still processing, like a bank transfer"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def charge(self, order):
+        self.calls += 1
+        return payments.PaymentResult(self.calls > 1, 'pi_slow')
+
+
+def charge_job():
+    return db.session.scalars(db.select(Job).filter_by(type='charge_order')).one()
+
+
+def test_worker_charges_queued_order(app, order):
+    assert Worker(app).run_pending() == 1
+
+    assert db.session.get(Order, order.id).payment_status == 'completed'
+    assert charge_job().status == 'done'
+    assert order.id in payments.payment_provider().charges
+
+
+def test_declined_charge_fails_order(app, order, monkeypatch):
+    monkeypatch.setitem(payments._providers, app, payments.StubPaymentProvider(decline=True))
+
+    Worker(app).run_pending()
+
+    assert db.session.get(Order, order.id).payment_status == 'failed'
+    assert charge_job().status == 'done'
+
+
+def test_failing_job_is_retried(app, order, monkeypatch):
+    provider = FlakyProvider(failures=2)
+    monkeypatch.setattr('tasks.payment_provider', lambda: provider)
+
+    # JOB_RETRY_DELAY is 0 under testing, so the retries are due at once
+    Worker(app).run_pending()
+
+    job = charge_job()
+    assert provider.calls == 3
+    assert (job.status, job.attempts) == ('done', 3)
+    assert 'provider unreachable' in job.last_error
+    assert db.session.get(Order, order.id).payment_status == 'completed'
+
+
+def test_job_fails_after_max_attempts(app, order, monkeypatch):
+    provider = FlakyProvider(failures=100)
+    monkeypatch.setattr('tasks.payment_provider', lambda: provider)
+
+    Worker(app).run_pending()
+
+    job = charge_job()
+    assert (job.status, job.attempts) == ('failed', job.max_attempts)
+    assert db.session.get(Order, order.id).payment_status == 'pending'
+
+
+def test_unsettled_charge_is_retried(app, order, monkeypatch):
+    provider = SlowProvider()
+    monkeypatch.setattr('tasks.payment_provider', lambda: provider)
+
+    Worker(app).run_pending()
+
+    assert charge_job().attempts == 2
+    assert db.session.get(Order, order.id).payment_status == 'completed'
+
+
+def test_production_refuses_stub_payments(monkeypatch):
+    from app import create_app
+    from config import ProductionConfig
+
+    monkeypatch.setattr(ProductionConfig, 'SECRET_KEY', 'not-the-default')
+    monkeypatch.setattr(ProductionConfig, 'PAYMENT_PROVIDER', 'stub')
+    with pytest.raises(RuntimeError, match='STRIPE_SECRET_KEY'):
+        create_app('production')
@@ -0,0 +1,56 @@
+# test_recommend.py - Similar-item indexes and their freshness across processes
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from models import db, Wildlife
+from recommend import recommendations, tfidf_matrix, tokenize, top_neighbours
+
+
+def test_tfidf_rows_are_normalised_and_sparse():
+    documents = [tokenize(text) for text in ['tiger forest night', 'leopard forest', '', 'river delta tiger']]
+    matrix = tfidf_matrix(documents)
+
+    assert matrix.nnz == 8
+    assert np.allclose(np.linalg.norm(matrix.toarray(), axis=1), [1, 1, 0, 1])
+
+
+def test_neighbours_prefer_shared_words_and_groups():
+    documents = [tokenize(text) for text in ['tiger forest night', 'tiger night', 'river delta', 'river delta birds']]
+    neighbours = top_neighbours(tfidf_matrix(documents), np.array([0, 0, 1, 1]), 1, 0.3)
+
+    assert neighbours == [[1], [0], [3], [2]]
+
+
+def test_changes_from_other_processes_trigger_a_rebuild(app, monkeypatch):
+    db.session.add_all([
+        Wildlife(title=f'Tiger {i}', description='tiger forest', price=1, category='Big Cats') for i in range(3)
+    ])
+    db.session.commit()
+    index = recommendations.indexes['wildlife']
+    rebuilds = []
+    monkeypatch.setattr(index, 'schedule_rebuild', rebuilds.append)
+    monkeypatch.setattr(index, 'check_interval', 0)
+
+    with app.test_request_context():
+        index.build()
+        index.similar(1)
+        assert rebuilds == []
+
+        # Written without this process's session, as another worker would
+        with db.engine.begin() as conn:
+            conn.execute(text('DELETE FROM wildlife WHERE id = 3'))
+        index.similar(1)
+        assert rebuilds == [app]
+
+
+def test_unbuilt_index_falls_back_instead_of_building(app, monkeypatch):
+    index = recommendations.indexes['safari']
+    rebuilds = []
+    monkeypatch.setattr(index, '_built', False)
+    monkeypatch.setattr(index, 'schedule_rebuild', rebuilds.append)
+    monkeypatch.setattr(index, 'build', lambda: pytest.fail('built inside a request'))
+
+    with app.test_request_context():
+        assert index.similar(1) is None
+    assert rebuilds == [app]